@@ -1,8 +1,12 @@
-import json
+import os
+import sys
 import numpy as np
 import matplotlib.pyplot as plt
 import pycello2.ucf
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'ucf-builder'))
+import ucf_index
+
 import argparse
 
 parser = argparse.ArgumentParser(
@@ -23,8 +27,14 @@ parser.add_argument(
 
 args = parser.parse_args()
 
-with open(args.ucf, 'r') as ucf_file:
-    ucf_json = json.load(ucf_file)
+# the cytometry and toxicity are most of a UCF and are not plotted, so
+# only the other collections are decoded, from their offsets
+ucf_offsets = ucf_index.UCFIndex(args.ucf)
+ucf_json = ucf_offsets.collections(collection=[
+    collection for collection in ucf_offsets.collection_types()
+    if collection not in ('gate_cytometry', 'gate_toxicity')
+])
+ucf_offsets.close()
 
 ucf = pycello2.ucf.UCF(ucf_json)
 
@@ -0,0 +1,68 @@
+import os
+import sys
+import csv
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),os.pardir))
+import ucf_builder
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)),os.pardir,'examples','cytometry.csv')
+
+def write_synthetic(filename,rows,gates,inputs):
+    # same layout as examples/cytometry.csv: one block of bins per
+    # (gate, input), gates and inputs in order of first appearance
+    bins = -(-rows // (gates * inputs))
+    written = 0
+    with open(filename,'w',newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(['gate_name','variable','input','bin','count'])
+        for g in range(gates):
+            gate_name = 'G%d_Synthetic' % g
+            for i in range(inputs):
+                cytometry_input = 0.001 * 2 ** i
+                for b in range(bins):
+                    if written == rows:
+                        return written
+                    writer.writerow([gate_name,'x',cytometry_input,0.001 * 1.0568 ** b,float(b % 7)])
+                    written += 1
+    return written
+
+def run(loader,filename):
+    start = time.perf_counter()
+    ucf = loader(filename,[])
+    elapsed = time.perf_counter() - start
+    return ucf, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Time add_cytometry on the example file and on synthetic files of increasing size.")
+    parser.add_argument("--rows", "-r", type=int, nargs='+', default=[100000,1000000,10000000], help="Synthetic row counts.", metavar="N")
+    parser.add_argument("--gates", "-g", type=int, default=200, help="Number of synthetic gates.", metavar="N")
+    parser.add_argument("--inputs", "-i", type=int, default=8, help="Number of synthetic inputs per gate.", metavar="N")
+    parser.add_argument("--columnar", action='store_true', help="Time the columnar (NumPy) loader instead.")
+    args = parser.parse_args()
+
+    if args.columnar:
+        import ucf_columnar
+        loader = ucf_columnar.add_cytometry
+    else:
+        loader = ucf_builder.add_cytometry
+
+    print("%12s %10s %14s" % ('rows','seconds','rows/sec'))
+
+    with open(EXAMPLE,'r') as csvfile:
+        rows = sum(1 for line in csvfile) - 1
+    ucf, elapsed = run(loader,EXAMPLE)
+    print("%12d %10.3f %14.0f  (examples/cytometry.csv)" % (rows,elapsed,rows / elapsed))
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir,'cytometry.csv')
+        for n in args.rows:
+            rows = write_synthetic(filename,n,args.gates,args.inputs)
+            ucf, elapsed = run(loader,filename)
+            print("%12d %10.3f %14.0f" % (rows,elapsed,rows / elapsed))
+            del ucf
+
+if __name__ == "__main__":
+    main()
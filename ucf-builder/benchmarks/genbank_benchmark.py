@@ -0,0 +1,54 @@
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),os.pardir))
+import genbank
+
+def synthetic(length,features,seed=0):
+    # the lines of a GenBank file, generated as they are read
+    rng = random.Random(seed)
+    yield "LOCUS       synthetic          %d bp ds-DNA     circular" % length
+    yield "FEATURES             Location/Qualifiers"
+    for i in range(features):
+        start = rng.randint(1,length - 2000)
+        end = start + rng.randint(0,2000)
+        location = "%d..%d" % (start,end)
+        if i % 2:
+            location = "complement(%s)" % location
+        yield "     %-16s%s" % ('CDS' if i % 3 else 'misc_feature',location)
+        yield "                     /label=f%d" % i
+    yield "ORIGIN"
+    bases = 'acgtacgtac' * 6
+    for n in range(0,length,60):
+        k = min(60,length - n)
+        yield "%9d %s" % (n + 1,' '.join(bases[i:min(i + 10,k)] for i in range(0,k,10)))
+    yield "//"
+
+def main():
+    parser = argparse.ArgumentParser(description="Time GenBank parsing and overlap queries on synthetic genomes.")
+    parser.add_argument("--length", "-l", type=int, nargs='+', default=[100000,1000000,5000000], help="Synthetic sequence lengths in bp.", metavar="BP")
+    parser.add_argument("--features", "-f", type=int, default=5000, help="Features per synthetic genome.", metavar="N")
+    parser.add_argument("--queries", "-q", type=int, default=10000, help="Overlap queries.", metavar="N")
+    args = parser.parse_args()
+
+    print("%10s %10s %10s %10s %12s %10s" % ('bp','features','parse','index','query','found'))
+    for length in args.length:
+        start = time.perf_counter()
+        record = genbank.parse(synthetic(length,args.features),'synthetic')
+        parsed = time.perf_counter()
+        record.index
+        indexed = time.perf_counter()
+        rng = random.Random(1)
+        found = 0
+        for _ in range(args.queries):
+            bp = rng.randint(1,length)
+            found += len(record.overlapping(bp,bp + 100))
+        queried = time.perf_counter()
+        print("%10d %10d %10.3f %10.3f %12.6f %10.1f" % (length,len(record.features),parsed - start,indexed - parsed,
+                                                        (queried - indexed) / args.queries,found / args.queries))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),os.pardir))
+import latch_screen
+import response_kernels
+
+def synthetic(gates,groups,seed=0):
+    # response_functions collections of random Hill repressors, and their groups
+    rng = random.Random(seed)
+    collections = []
+    group = {}
+    for i in range(gates):
+        ymin = 10 ** rng.uniform(-3,-1)
+        parameters = {'ymin': ymin,
+                      'ymax': ymin * 10 ** rng.uniform(1,3),
+                      'K': 10 ** rng.uniform(-2,0),
+                      'n': rng.uniform(1,4)}
+        name = "g%d" % i
+        collections.append({'collection': 'response_functions',
+                            'gate_name': name,
+                            'equation': response_kernels.HILL,
+                            'parameters': [{'name': k,'value': v} for (k,v) in parameters.items()]})
+        group[name] = "group%d" % rng.randrange(groups)
+    return collections, group
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the latch screen on synthetic libraries of Hill gates.")
+    parser.add_argument("--gates", "-g", type=int, nargs='+', default=[100,300,1000], help="Library sizes.", metavar="N")
+    parser.add_argument("--points", "-m", type=int, default=latch_screen.POINTS, help="Points of the shared grid.", metavar="N")
+    parser.add_argument("--jobs", "-j", type=int, default=1, help="Processes.", metavar="N")
+    args = parser.parse_args()
+
+    print("%8s %10s %10s %10s %10s" % ('gates','pairs','bistable','setup','screen'))
+    for gates in args.gates:
+        (collections,groups) = synthetic(gates,max(1,gates // 3))
+        start = time.perf_counter()
+        screen = latch_screen.LatchScreen(collections,groups,args.points,None)
+        setup = time.perf_counter()
+        pairs = screen.screen(args.jobs)
+        screened = time.perf_counter()
+        print("%8d %10d %10d %10.3f %10.3f" % (gates,len(pairs['i']),(pairs['stable'] >= 2).sum(),setup - start,screened - setup))
+
+if __name__ == "__main__":
+    main()
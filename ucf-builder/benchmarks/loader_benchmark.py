@@ -0,0 +1,131 @@
+import os
+import sys
+import csv
+import time
+import argparse
+import tempfile
+import warnings
+import subprocess
+import importlib.util
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),os.pardir))
+import ucf_builder
+
+BUILDER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),os.pardir)
+
+# synthetic inputs: rows -> (header, row) generators
+
+def gates(n):
+    header = ['regulator','group_name','gate_name','gate_type','system','color_hexcode']
+    return header, (['R%d' % (i // 3),'R%d' % (i // 3),'G%d_R%d' % (i,i // 3),'NOR','TetR','3BA9E0'] for i in range(n))
+
+def logic_constraints(n):
+    header = ['type','max_instances']
+    return header, (['T%d' % i,str(i)] for i in range(n))
+
+def response_functions(n):
+    parameters = 8
+    header = ['gate_name','equation','variable_name','off_threshold','on_threshold'] + ['parameter_name','value'] * parameters
+    def row(i):
+        r = ['G%d' % i,'ymin+(ymax-ymin)/(1.0+(x/K)^n)','x',0.01 * (i % 97 + 1),0.5 + i % 13]
+        for k in range(parameters):
+            r += ['p%d' % k,1.0 / (i + k + 1)]
+        return r
+    return header, (row(i) for i in range(n))
+
+def parts(n):
+    header = ['name','type','dnasequence']
+    return header, (['P%d' % i,'cds','ACGT' * (25 + i % 50)] for i in range(n))
+
+def toxicity(n):
+    header = ['gate_name','variable','input','growth']
+    return header, (['G%d' % (i // 12),'x',0.01 * 1.8 ** (i % 12),1.0 - 0.001 * (i % 50)] for i in range(n))
+
+def cytometry(n):
+    header = ['gate_name','variable','input','bin','count']
+    return header, (['G%d' % (i // 3000),'x',0.001 * 2 ** (i // 250 % 12),0.001 * 1.0568 ** (i % 250),float(i % 7)] for i in range(n))
+
+LOADERS = {'gates': gates,
+           'logic_constraints': logic_constraints,
+           'response_functions': response_functions,
+           'parts': parts,
+           'toxicity': toxicity,
+           'cytometry': cytometry}
+
+def write(filename,header,rows):
+    with open(filename,'w',newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+def git(*args):
+    return subprocess.run(['git'] + list(args),cwd=BUILDER_DIR,check=True,stdout=subprocess.PIPE).stdout
+
+def baseline_builder(revision,tmpdir):
+    # ucf_builder.py as of an earlier revision, imported under another name
+    if revision is None:
+        revision = git('rev-list','--max-parents=0','HEAD').split()[-1].decode()
+    prefix = git('rev-parse','--show-prefix').decode().strip()
+    filename = os.path.join(tmpdir,'baseline_ucf_builder.py')
+    with open(filename,'wb') as pyfile:
+        pyfile.write(git('show','%s:%sucf_builder.py' % (revision,prefix)))
+    spec = importlib.util.spec_from_file_location('baseline_ucf_builder',filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return revision, module
+
+EXAMPLES_DIR = os.path.join(BUILDER_DIR,'examples')
+
+def run(loader,filename,repeat=1):
+    # the collections and the best time of repeat loads
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        ucf = loader(filename,[])
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best,elapsed)
+    return ucf, best
+
+def inputs(args,tmpdir):
+    # (input, rows, filename) of each file to load
+    for name in args.inputs:
+        if args.examples:
+            filename = os.path.join(EXAMPLES_DIR,name + '.csv')
+            with open(filename,'r') as csvfile:
+                rows = sum(1 for row in csv.reader(csvfile) if row) - 1
+            yield name, rows, filename
+            continue
+        for n in args.rows:
+            filename = os.path.join(tmpdir,name + '.csv')
+            header, rows = LOADERS[name](n)
+            write(filename,header,rows)
+            yield name, n, filename
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the loaders of ucf_builder with those of an earlier revision.")
+    parser.add_argument("--rows", "-r", type=int, nargs='+', default=[1000,10000], help="Synthetic row counts.", metavar="N")
+    parser.add_argument("--inputs", "-i", nargs='+', default=list(LOADERS.keys()), choices=list(LOADERS.keys()), help="Inputs to benchmark.")
+    parser.add_argument("--baseline", "-b", help="Git revision to compare with (default the first commit).", metavar="REV")
+    parser.add_argument("--examples", "-e", action='store_true', help="Load the example inputs instead of synthetic ones.")
+    parser.add_argument("--repeat", "-n", type=int, default=1, help="Report the best of N loads.", metavar="N")
+    args = parser.parse_args()
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1.")
+
+    # duplicate parts warn, and the baseline parts and response function
+    # loaders are quadratic, so keep the row counts moderate
+    warnings.simplefilter('ignore',RuntimeWarning)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        (revision,baseline) = baseline_builder(args.baseline,tmpdir)
+        print("baseline %s" % revision)
+        print("%-20s %10s %12s %12s %8s" % ('input','rows','baseline ms','current ms','speedup'))
+        for (name,n,filename) in inputs(args,tmpdir):
+            old, t_old = run(getattr(baseline,'add_' + name),filename,args.repeat)
+            new, t_new = run(getattr(ucf_builder,'add_' + name),filename,args.repeat)
+            if old != new:
+                raise RuntimeError("Loaders disagree on %s." % name)
+            print("%-20s %10d %12.3f %12.3f %7.2fx" % (name,n,1000 * t_old,1000 * t_new,t_old / t_new))
+
+if __name__ == "__main__":
+    main()
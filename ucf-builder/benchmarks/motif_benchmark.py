@@ -0,0 +1,54 @@
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),os.pardir))
+from motif_library import Motif, MotifLibrary, FunctionIndex
+
+def synthetic(n,inputs,seed=0):
+    # random NOR/NOT netlists, wires named like the std library's 0WireN
+    rng = random.Random(seed)
+    names = [chr(ord('a') + i) for i in range(inputs)]
+    wire = 0
+    records = []
+    for _ in range(n):
+        wires = list(names)
+        netlist = []
+        for _ in range(rng.randint(1,8)):
+            out = '%dWire%d' % (rng.randint(0,9),wire)
+            wire += 1
+            if rng.random() < 0.4:
+                netlist.append('NOT(%s,%s)' % (out,rng.choice(wires)))
+            else:
+                netlist.append('NOR(%s,%s)' % (out,','.join(rng.sample(wires,2) if len(wires) > 1 else wires * 2)))
+            wires.append(out)
+        netlist[-1] = netlist[-1].replace(wires[-1] + ',','y,',1)
+        records.append({'outputs': ['y'],'inputs': names,'netlist': netlist,'collection': 'motif_library'})
+    return records
+
+def main():
+    parser = argparse.ArgumentParser(description="Time motif canonicalization and the truth-table index on synthetic libraries.")
+    parser.add_argument("--motifs", "-m", type=int, nargs='+', default=[10000,100000], help="Synthetic motif counts.", metavar="N")
+    parser.add_argument("--inputs", "-i", type=int, default=3, help="Inputs per motif.", metavar="N")
+    args = parser.parse_args()
+
+    print("%10s %10s %10s %10s %10s %10s" % ('motifs','unique','functions','parse','index','lookup'))
+    for n in args.motifs:
+        records = synthetic(n,args.inputs)
+
+        start = time.perf_counter()
+        library = MotifLibrary(Motif.from_dict(r) for r in records)
+        parsed = time.perf_counter()
+        index = FunctionIndex(library)
+        indexed = time.perf_counter()
+        for (inputs,tables) in index.functions():
+            index.smallest(tables,inputs)
+        looked_up = time.perf_counter()
+
+        print("%10d %10d %10d %10.3f %10.3f %10.6f" % (n,len(library),len(index),parsed - start,
+                                                      indexed - parsed,(looked_up - indexed) / max(len(index),1)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),os.pardir))
+from gate_orderings import Orderings
+
+def synthetic(n,density,seed=0):
+    # BEFORE rules between random pairs of a hidden order, so never a cycle
+    rng = random.Random(seed)
+    gates = ['gate_G%d' % i for i in range(n)]
+    hidden = list(gates)
+    rng.shuffle(hidden)
+    edges = [(hidden[i],hidden[j]) for i in range(n) for j in range(i + 1,n) if rng.random() < density]
+    return gates, edges
+
+def main():
+    parser = argparse.ArgumentParser(description="Time counting and sampling gate orderings on synthetic rules.")
+    parser.add_argument("--gates", "-g", type=int, nargs='+', default=[8,12,16,20], help="Synthetic gate counts.", metavar="N")
+    parser.add_argument("--density", "-d", type=float, nargs='+', default=[0.0,0.1,0.3], help="Probability of a rule between two gates.", metavar="P")
+    parser.add_argument("--samples", "-n", type=int, default=1000, help="Orderings to sample.", metavar="N")
+    args = parser.parse_args()
+
+    print("%6s %8s %8s %10s %26s %10s %10s" % ('gates','density','rules','states','orderings','count','sample'))
+    for n in args.gates:
+        for density in args.density:
+            gates, edges = synthetic(n,density)
+            orderings = Orderings(gates,edges)
+
+            start = time.perf_counter()
+            count = orderings.count()
+            counted = time.perf_counter()
+            rng = random.Random(0)
+            for _ in range(args.samples):
+                orderings.sample(rng)
+            sampled = time.perf_counter()
+
+            print("%6d %8.2f %8d %10d %26d %10.3f %10.6f" % (n,density,len(edges),len(orderings.table()),count,
+                                                            counted - start,(sampled - counted) / max(args.samples,1)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import io
+import os
+import sys
+import time
+import argparse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0,os.path.join(HERE,os.pardir))
+sys.path.insert(0,os.path.join(HERE,os.pardir,os.pardir,'ucf-cytometry-viewer'))
+import ucf_index
+import ucf_cytometry_viewer as viewer
+
+EXAMPLE = os.path.join(HERE,os.pardir,os.pardir,'ucf-cytometry-viewer','examples','Eco1C1G1T1-synbiohub.UCF.json')
+
+def render(cytometry,bars,format):
+    # seconds to draw and save the figure, and the size of the file
+    start = time.perf_counter()
+    fig = viewer.plot(cytometry,bars)
+    out = io.BytesIO()
+    fig.savefig(out,format=format,bbox_inches='tight')
+    viewer.plt.close(fig)
+    return time.perf_counter() - start, len(out.getvalue())
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the cytometry plots drawn with one bar per bin and with one polygon per input.")
+    parser.add_argument("--ucf", "-u", default=EXAMPLE, help="UCF file, by default the example.", metavar="FILE")
+    parser.add_argument("--gate", "-g", action='append', help="Gate to plot; every gate with cytometry by default.", metavar="GATE")
+    parser.add_argument("--format", "-f", nargs='+', default=['png','pdf','svg'], help="Output formats.", metavar="FORMAT")
+    args = parser.parse_args()
+
+    ucf = ucf_index.load(args.ucf,'gate_cytometry',args.gate)
+    gates = args.gate if args.gate else [x.gate_name for x in ucf.collections('gate_cytometry')]
+
+    print("%-6s %6s %10s %12s %10s %12s %8s" % ('format','gates','bars s','bars bytes','fill s','fill bytes','speedup'))
+    for format in args.format:
+        totals = [0.0,0,0.0,0]
+        for gate in gates:
+            cytometry = viewer.read_cytometry(ucf,gate)
+            totals[0:2] = [a + b for (a,b) in zip(totals[0:2],render(cytometry,True,format))]
+            totals[2:4] = [a + b for (a,b) in zip(totals[2:4],render(cytometry,False,format))]
+        print("%-6s %6d %10.2f %12d %10.2f %12d %8.1f" % (format,len(gates),totals[0],totals[1],totals[2],totals[3],
+                                                       totals[0] / totals[2]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),os.pardir))
+import ucf_validate
+
+def synthetic(parts,gates):
+    ucf = []
+    for i in range(parts):
+        ucf.append({'collection': 'parts','name': 'P%d' % i,'type': 'cds','dnasequence': 'ACGT'})
+    for g in range(gates):
+        name = 'G%d' % g
+        ucf.append({'collection': 'gates','gate_name': name})
+        ucf.append({'collection': 'response_functions','gate_name': name})
+        ucf.append({'collection': 'gate_parts',
+                    'gate_name': name,
+                    'expression_cassettes': [{'maps_to_variable': 'x',
+                                              'cassette_parts': ['P%d' % ((g * 4 + k) % parts) for k in range(4)]}],
+                    'promoter': 'P%d' % ((g * 7) % parts)})
+        ucf.append({'collection': 'gate_toxicity','gate_name': name,'maps_to_variable': 'x'})
+        ucf.append({'collection': 'gate_cytometry','gate_name': name})
+    return ucf
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the UCF cross-reference validation on synthetic libraries.")
+    parser.add_argument("--parts", "-p", type=int, nargs='+', default=[10000,100000], help="Synthetic part counts.", metavar="N")
+    parser.add_argument("--gates", "-g", type=int, default=5000, help="Synthetic gate count.", metavar="N")
+    args = parser.parse_args()
+
+    print("%10s %10s %10s %10s %10s" % ('parts','gates','records','seconds','problems'))
+    for parts in args.parts:
+        ucf = synthetic(parts,args.gates)
+        start = time.perf_counter()
+        problems = ucf_validate.validate(ucf)
+        elapsed = time.perf_counter() - start
+        print("%10d %10d %10d %10.3f %10d" % (parts,args.gates,len(ucf),elapsed,len(problems)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+__author__  = 'Timothy S. Jones <jonests@bu.edu>, Densmore Lab, BU'
+__license__ = 'GPL3'
+
+# Declarative schemas for the CSV inputs of ucf_builder.
+#
+# A Schema lists the columns of an input, each with a type and whether it
+# may be empty, plus repeated groups such as the parameter_name,value
+# pairs of the response functions. Compiling a schema against the header of
+# a file resolves every column to its position and converter once, so
+# decoding a row is a fixed sequence of indexing and conversions with no
+# lookups by name or branching on the header. Rows that fail to decode are
+# collected, and check() reports all of them at once after the pass.
+#
+# For small files of plain string columns (gates, logic constraints)
+# compiling a schema costs more than reading the rows, so StringColumns
+# only checks the header and gives the positions; the loader indexes its
+# rows and a schema is compiled only to explain the rows it rejects.
+
+class Column:
+    def __init__(self,name,type=str,required=True):
+        self.name = name
+        self.type = type
+        self.required = required
+
+class Group:
+    """Columns that may repeat, each repetition starting with the leader.
+
+    A repetition whose leader is empty is skipped; otherwise all of its
+    columns are required. Decoded rows hold a list of tuples per group.
+    """
+
+    def __init__(self,leader,columns):
+        self.leader = leader
+        self.columns = columns
+
+    @property
+    def names(self):
+        return [c.name for c in [self.leader] + self.columns]
+
+class Schema:
+    def __init__(self,columns,groups=()):
+        self.columns = columns
+        self.groups = list(groups)
+
+    def compile(self,header,filename):
+        fixed = {c.name: c for c in self.columns}
+        leaders = {g.leader.name: g for g in self.groups}
+
+        positions = {}
+        instances = {g.leader.name: [] for g in self.groups}
+        current = None
+        for i,key in enumerate(header):
+            if key in fixed and key not in positions:
+                positions[key] = i
+                current = None
+            elif key in leaders:
+                current = (leaders[key],{key: i})
+                instances[key].append(current[1])
+            elif current is not None and key in current[0].names and key not in current[1]:
+                current[1][key] = i
+            else:
+                raise RuntimeError("Unexpected header key in %s at position %d." % (filename,i))
+
+        for c in self.columns:
+            if c.name not in positions:
+                raise RuntimeError("'%s' required in header of %s." % (c.name,filename))
+        for g in self.groups:
+            for instance in instances[g.leader.name]:
+                for name in g.names:
+                    if name not in instance:
+                        raise RuntimeError("'%s' required after '%s' at position %d of %s."
+                                           % (name,g.leader.name,instance[g.leader.name],filename))
+
+        fields = [(c,positions[c.name]) for c in self.columns]
+        groups = [(g,[[instance[c.name] for c in [g.leader] + g.columns]
+                      for instance in instances[g.leader.name]])
+                  for g in self.groups]
+        return RowDecoder(filename,fields,groups)
+
+class StringColumns:
+    """The positions of the string columns of a header, checked as
+    Schema.compile() checks them."""
+
+    def __init__(self,header,names,filename,required=()):
+        self.header = header
+        self.names = names
+        self.filename = filename
+        self.required = required
+        self._rejected = []
+        found = {}
+        for (i,key) in enumerate(header):
+            if key not in names or key in found:
+                raise RuntimeError("Unexpected header key in %s at position %d." % (filename,i))
+            found[key] = i
+        for name in names:
+            if name not in found:
+                raise RuntimeError("'%s' required in header of %s." % (name,filename))
+        self.positions = [found[name] for name in names]
+
+    def reject(self,line,row):
+        """Note a row that is too short or misses a required value."""
+        self._rejected.append((line,row))
+
+    def check(self):
+        """Raise the RuntimeError of RowDecoder.check() for the rejected rows."""
+        if len(self._rejected) > 0:
+            schema = Schema([Column(name,required=name in self.required) for name in self.names])
+            decoder = schema.compile(self.header,self.filename)
+            for (line,row) in self._rejected:
+                decoder.reject(line,decoder._diagnose(row))
+            decoder.check()
+
+class RowDecoder:
+    def __init__(self,filename,fields,groups):
+        self.filename = filename
+        self.fields = fields
+        self.groups = groups
+        self.errors = []
+        self.columns = {c.name: i for (c,i) in fields}
+        # each cell as its position and converter (None for str), resolved
+        # once here so the read loop does no lookups
+        self._fields = [(index,None if c.type is str else c.type,c.required) for (c,index) in fields]
+        self._groups = [[(indexes[0],[(index,None if c.type is str else c.type)
+                                      for (c,index) in zip(g.columns,indexes[1:])])
+                         for indexes in instances]
+                        for (g,instances) in groups]
+
+    def reject(self,line,message):
+        """Report a row the loader rejects, with the bad rows of rows()."""
+        self.errors.append((line,message))
+
+    def _diagnose(self,row):
+        # the slow path, only taken for rows the read loop rejects
+        def check(c,index,required):
+            if index >= len(row):
+                return "'%s' missing, the row has %d columns." % (c.name,len(row))
+            value = row[index]
+            if len(value) == 0:
+                return "'%s' not specified." % c.name if required else None
+            if c.type is not str:
+                try:
+                    c.type(value)
+                except ValueError:
+                    return "'%s' value '%s' is not a %s." % (c.name,value,c.type.__name__)
+            return None
+
+        for (c,index) in self.fields:
+            message = check(c,index,c.required)
+            if message:
+                return message
+        for (g,instances) in self.groups:
+            for indexes in instances:
+                message = check(g.leader,indexes[0],False)
+                if message:
+                    return message
+                if len(row[indexes[0]]) == 0:
+                    continue
+                for (c,index) in zip(g.columns,indexes[1:]):
+                    message = check(c,index,True)
+                    if message:
+                        return "%s (%s '%s')" % (message,g.leader.name,row[indexes[0]])
+        return "Invalid row."
+
+    def rows(self,reader):
+        """Decode the rows of a csv.reader, skipping empty and bad rows."""
+        fields = self._fields
+        groups = self._groups
+        for row in reader:
+            if not row:
+                continue
+            try:
+                values = []
+                for (index,convert,required) in fields:
+                    value = row[index]
+                    if value:
+                        if convert is not None:
+                            value = convert(value)
+                    elif required:
+                        raise ValueError
+                    elif convert is not None:
+                        value = None
+                    values.append(value)
+                for instances in groups:
+                    repeats = []
+                    for (leader,columns) in instances:
+                        key = row[leader]
+                        if not key:
+                            continue
+                        repeat = [key]
+                        for (index,convert) in columns:
+                            value = row[index]
+                            if not value:
+                                raise ValueError
+                            repeat.append(value if convert is None else convert(value))
+                        repeats.append(tuple(repeat))
+                    values.append(repeats)
+            except (ValueError,IndexError):
+                self.errors.append((reader.line_num,self._diagnose(row)))
+                continue
+            yield tuple(values)
+
+    def check(self):
+        """Raise a RuntimeError listing every bad row seen by rows()."""
+        if len(self.errors) > 0:
+            raise RuntimeError("%d invalid rows in %s:\n%s"
+                               % (len(self.errors),self.filename,
+                                  "\n".join("  line %d: %s" % e for e in self.errors)))
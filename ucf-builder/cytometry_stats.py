@@ -0,0 +1,124 @@
+import sys
+import csv
+import json
+import argparse
+import numpy
+
+import ucf_stream
+
+__author__  = 'Timothy S. Jones <jonests@bu.edu>, Densmore Lab, BU'
+__license__ = 'GPL3'
+
+# Summary statistics of the cytometry histograms of a UCF.
+#
+# The histograms of every gate and input are stacked into two 2-D arrays,
+# bins and counts, one row per histogram (shorter histograms are padded
+# with empty bins), and the count-weighted mean, geometric mean, standard
+# deviation, CV and quantiles are computed for all rows at once. A quantile
+# is the first bin whose cumulative count reaches that fraction of the
+# total, so the median of a histogram is one of its bins.
+
+QUANTILES = [0.5]
+
+class Histograms:
+    """The cytometry histograms of a UCF, one row per gate and input."""
+
+    def __init__(self,ucf):
+        rows = [(x.gate_name,data) for x in ucf.collections('gate_cytometry') for data in x.data]
+        width = max([len(data.bins) for (gate,data) in rows],default=0)
+        self.gate_name = [gate for (gate,data) in rows]
+        self.variable = [data.variable for (gate,data) in rows]
+        self.input = numpy.array([data.input for (gate,data) in rows],dtype=float)
+        # padding bins of 1 with no counts add nothing to any sum, and
+        # their logarithm is 0
+        self.bins = numpy.ones((len(rows),width))
+        self.counts = numpy.zeros((len(rows),width))
+        for (i,(gate,data)) in enumerate(rows):
+            if len(data.bins) != len(data.counts):
+                raise RuntimeError("Cytometry of gate '%s' input %g has %d bins and %d counts." %
+                                   (gate,data.input,len(data.bins),len(data.counts)))
+            self.bins[i,:len(data.bins)] = data.bins
+            self.counts[i,:len(data.counts)] = data.counts
+
+    def __len__(self):
+        return len(self.gate_name)
+
+def summary(histograms,quantiles=QUANTILES):
+    """The statistics of every histogram, as a dict of arrays by name."""
+    b = histograms.bins
+    w = histograms.counts
+    total = w.sum(axis=1)
+    with numpy.errstate(divide='ignore',invalid='ignore'):
+        mean = (w * b).sum(axis=1) / total
+        sd = numpy.sqrt((w * (b - mean[:,None]) ** 2).sum(axis=1) / total)
+        geomean = numpy.exp((w * numpy.log(b)).sum(axis=1) / total)
+
+    stats = {'total': total,
+             'mean': mean,
+             'geomean': geomean,
+             'sd': sd,
+             'cv': sd / mean}
+    if len(quantiles) > 0 and b.shape[1] > 0:
+        q = numpy.asarray(quantiles,dtype=float)
+        # the first bin whose cumulative count reaches each fraction of the
+        # total, within rounding, and never past the last occupied bin
+        threshold = total[:,None] * q[None,:] * (1 - 1e-9)
+        first = (numpy.cumsum(w,axis=1)[:,:,None] < threshold[:,None,:]).sum(axis=1)
+        last = w.shape[1] - 1 - numpy.argmax(w[:,::-1] > 0,axis=1)
+        values = numpy.take_along_axis(b,numpy.minimum(first,last[:,None]),axis=1)
+        values[total == 0] = numpy.nan
+        for (j,p) in enumerate(quantiles):
+            stats[quantile_name(p)] = values[:,j]
+    return stats
+
+def quantile_name(p):
+    return 'median' if p == 0.5 else 'q%g' % p
+
+def table(filename,quantiles=QUANTILES):
+    """The rows of statistics of the cytometry of a UCF file."""
+    histograms = Histograms(ucf_stream.load(filename,'gate_cytometry'))
+    stats = summary(histograms,quantiles)
+    columns = {key: values.tolist() for (key,values) in stats.items()}
+    rows = []
+    for i in range(len(histograms)):
+        row = {'ucf': filename,
+               'gate_name': histograms.gate_name[i],
+               'variable': histograms.variable[i],
+               'input': float(histograms.input[i])}
+        for (key,values) in columns.items():
+            row[key] = values[i]
+        rows.append(row)
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Summary statistics of the cytometry histograms of UCFs.")
+    parser.add_argument("ucf", nargs='+', help="UCF files.", metavar="FILE")
+    parser.add_argument("--quantiles", "-q", type=float, nargs='+', default=QUANTILES, help="Quantiles to report, in (0, 1] (default the median).", metavar="Q")
+    parser.add_argument("--format", "-f", choices=['csv','json'], default='csv', help="Output format.")
+    parser.add_argument("--outfile", help="Write the table to this file instead of standard output.", metavar="FILE")
+    args = parser.parse_args()
+    for q in args.quantiles:
+        if not 0 < q <= 1:
+            parser.error("--quantiles must be in (0, 1].")
+    quantiles = list(dict.fromkeys(args.quantiles))
+
+    rows = []
+    for filename in args.ucf:
+        rows += table(filename,quantiles)
+
+    outfile = open(args.outfile,'w',newline='') if args.outfile else sys.stdout
+    if args.format == 'json':
+        # NaN, for an empty histogram, is written as null
+        json.dump([{k: None if v != v else v for (k,v) in row.items()} for row in rows],outfile,indent=2)
+        outfile.write('\n')
+    else:
+        fields = ['ucf','gate_name','variable','input','total','mean','geomean','sd','cv'] + \
+                 [quantile_name(q) for q in quantiles]
+        writer = csv.DictWriter(outfile,fields,lineterminator='\n')
+        writer.writeheader()
+        writer.writerows(rows)
+    if args.outfile:
+        outfile.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+import argparse
+import warnings
+
+__author__  = 'Timothy S. Jones <jonests@bu.edu>, Densmore Lab, BU'
+__license__ = 'GPL3'
+
+# Compiler for the Eugene placement rules of a UCF.
+#
+# "A BEFORE B" statements become the edges of a precedence graph, and
+# "STARTSWITH A" statements the set of parts a device may start with. Any
+# other statement (e.g. ALL_FORWARD) is kept as it is. Compiling finds the
+# cycles, which no placement can satisfy, and the STARTSWITH parts that must
+# follow a part outside the STARTSWITH set, which can then never share a
+# device with it. The transitive reduction keeps only the BEFORE rules that
+# no chain of other rules implies: it is computed over the nodes in reverse
+# topological order with the reachable set of each node held as an integer
+# bitset, so it stays cheap for dense orders such as the gate rules, where
+# every pair is listed.
+
+S_BEFORE = 'BEFORE'
+S_STARTSWITH = 'STARTSWITH'
+
+class RuleGraph:
+    def __init__(self,rules,filename='<rules>'):
+        self.filename = filename
+        self.rules = list(rules)
+        self.nodes = {}
+        self.edges = {}
+        self.starts = []
+        # (kind, value) per statement: kind is BEFORE, STARTSWITH or None
+        self._statements = []
+
+        for (i,line) in enumerate(self.rules):
+            words = line.split()
+            if len(words) == 3 and words[1] == S_BEFORE:
+                edge = (self._node(words[0]),self._node(words[2]))
+                if edge[0] == edge[1]:
+                    raise RuntimeError("Rule '%s' at line %d of %s orders a part before itself."
+                                       % (line,i + 1,filename))
+                if edge not in self.edges:
+                    self.edges[edge] = i
+                self._statements.append((S_BEFORE,edge))
+            elif len(words) == 2 and words[0] == S_STARTSWITH:
+                node = self._node(words[1])
+                if node not in self.starts:
+                    self.starts.append(node)
+                self._statements.append((S_STARTSWITH,node))
+            else:
+                self._statements.append((None,line))
+
+        self._names = list(self.nodes)
+        self._children = [[] for _ in self._names]
+        for (u,v) in self.edges:
+            self._children[u].append(v)
+        self._order = self._topological_order()
+
+    def _node(self,name):
+        if name not in self.nodes:
+            self.nodes[name] = len(self.nodes)
+        return self.nodes[name]
+
+    def _topological_order(self):
+        # Kahn's algorithm, None when there is a cycle
+        indegree = [0] * len(self._names)
+        for (u,v) in self.edges:
+            indegree[v] += 1
+        ready = [u for u in range(len(self._names)) if indegree[u] == 0]
+        order = []
+        while ready:
+            u = ready.pop()
+            order.append(u)
+            for v in self._children[u]:
+                indegree[v] -= 1
+                if indegree[v] == 0:
+                    ready.append(v)
+        return order if len(order) == len(self._names) else None
+
+    def cycle(self):
+        """The parts of one cycle of BEFORE rules, or None."""
+        if self._order is not None:
+            return None
+        state = [0] * len(self._names)
+        for root in range(len(self._names)):
+            if state[root]:
+                continue
+            path = [root]
+            stack = [iter(self._children[root])]
+            state[root] = 1
+            while stack:
+                v = next(stack[-1],None)
+                if v is None:
+                    state[path.pop()] = 2
+                    stack.pop()
+                elif state[v] == 1:
+                    cycle = path[path.index(v):] + [v]
+                    return [self._names[u] for u in cycle]
+                elif state[v] == 0:
+                    state[v] = 1
+                    path.append(v)
+                    stack.append(iter(self._children[v]))
+        return None
+
+    def check(self):
+        """Raise a RuntimeError if the BEFORE rules have a cycle."""
+        cycle = self.cycle()
+        if cycle is not None:
+            raise RuntimeError("Placement rules in %s have a cycle: %s."
+                               % (self.filename,' BEFORE '.join(cycle)))
+
+    def _reachable(self):
+        # bitset of the nodes each node must precede, and the reduced edges
+        reach = [0] * len(self._names)
+        position = [0] * len(self._names)
+        for (i,u) in enumerate(self._order):
+            position[u] = i
+        kept = set()
+        for u in reversed(self._order):
+            covered = 0
+            # a child implied through another child comes later in the order
+            for v in sorted(self._children[u],key=position.__getitem__):
+                if not (covered >> v) & 1:
+                    kept.add((u,v))
+                    covered |= reach[v] | (1 << v)
+            reach[u] = covered
+        return reach, kept
+
+    def precedence(self):
+        """Every part named, with the parts the rules place after it."""
+        self.check()
+        reach, _ = self._reachable()
+        return {self._names[u]: [self._names[v] for v in range(len(self._names)) if (reach[u] >> v) & 1]
+                for u in range(len(self._names))}
+
+    def conflicts(self):
+        """(part, STARTSWITH part) pairs that can never share a device."""
+        self.check()
+        reach, _ = self._reachable()
+        starts = set(self.starts)
+        conflicts = []
+        for u in range(len(self._names)):
+            if u in starts:
+                continue
+            for s in self.starts:
+                if (reach[u] >> s) & 1:
+                    conflicts.append((self._names[u],self._names[s]))
+        return conflicts
+
+    def redundant(self):
+        """The BEFORE rules implied by the others, as (first, second) names."""
+        self.check()
+        _, kept = self._reachable()
+        return [(self._names[u],self._names[v]) for (u,v) in self.edges if (u,v) not in kept]
+
+    def reduced(self):
+        """The rules without redundant or repeated statements, in file order."""
+        self.check()
+        _, kept = self._reachable()
+        rules = []
+        seen = set()
+        for (kind,value) in self._statements:
+            if kind is None:
+                rules.append(value)
+                continue
+            if (kind,value) in seen:
+                continue
+            seen.add((kind,value))
+            if kind == S_BEFORE:
+                if value in kept:
+                    rules.append("%s %s %s" % (self._names[value[0]],S_BEFORE,self._names[value[1]]))
+            else:
+                rules.append("%s %s" % (S_STARTSWITH,self._names[value]))
+        return rules
+
+def compile_rules(filename):
+    """Read a rules file, check it and warn of STARTSWITH conflicts."""
+    with open(filename,'r') as rulesfile:
+        graph = RuleGraph(rulesfile.read().splitlines(),filename)
+    graph.check()
+    for (part,start) in graph.conflicts():
+        warnings.warn("'%s' must start a device but follows '%s' in %s." % (start,part,filename),RuntimeWarning)
+    return graph
+
+def main():
+    parser = argparse.ArgumentParser(description="Check Eugene placement rules and print them without redundant rules.")
+    parser.add_argument("rules", help="Rules file.", metavar="FILE")
+    parser.add_argument("--redundant", dest="redundant", action='store_true', help="Print the redundant rules instead.")
+    args = parser.parse_args()
+
+    try:
+        graph = compile_rules(args.rules)
+    except RuntimeError as e:
+        print(e)
+        raise SystemExit(1)
+
+    if args.redundant:
+        for (first,second) in graph.redundant():
+            print("%s %s %s" % (first,S_BEFORE,second))
+    else:
+        for rule in graph.reduced():
+            print(rule)
+
+if __name__ == "__main__":
+    main()
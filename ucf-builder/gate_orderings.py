@@ -0,0 +1,137 @@
+import csv
+import random
+import argparse
+
+from eugene_rules import RuleGraph
+
+__author__  = 'Timothy S. Jones <jonests@bu.edu>, Densmore Lab, BU'
+__license__ = 'GPL3'
+
+# Counting and uniform sampling of the orderings allowed by BEFORE rules.
+#
+# An ordering is built one element at a time, and the elements placed so far
+# always form a set closed under the rules (every element placed before
+# them is placed too), held as a bitmask. The number of ways to finish from
+# such a set is the sum of the ways after adding each element whose
+# predecessors are all placed, so one table of counts over the reachable
+# sets gives the number of orderings (the count from the empty set). The
+# table is filled layer by layer, without recursion, and only holds the
+# closed sets, which for rule sets such as gate_rules.txt are far fewer than
+# the 2^n masks. A uniform ordering is drawn by walking the table from the
+# empty set, picking each next element with probability proportional to the
+# count it leads to.
+
+class Orderings:
+    def __init__(self,items,edges):
+        """items are the names to order, edges (first, second) pairs of them."""
+        self.items = list(items)
+        index = {item: i for (i,item) in enumerate(self.items)}
+        if len(index) != len(self.items):
+            raise RuntimeError("Items to order are not distinct.")
+        self._predecessors = [0] * len(self.items)
+        for (first,second) in edges:
+            self._predecessors[index[second]] |= 1 << index[first]
+        self._ways = None
+
+    @classmethod
+    def from_rules(cls,graph,items=None):
+        """The orderings of items (default every part named) under a RuleGraph.
+
+        Rules through parts that are not items still order the items.
+        """
+        precedence = graph.precedence()
+        if items is None:
+            items = list(precedence)
+        items = list(items)
+        wanted = set(items)
+        edges = [(first,second) for first in items
+                 for second in precedence.get(first,()) if second in wanted]
+        return cls(items,edges)
+
+    def _available(self,mask):
+        free = ~mask & ((1 << len(self.items)) - 1)
+        while free:
+            bit = free & -free
+            free ^= bit
+            v = bit.bit_length() - 1
+            if self._predecessors[v] & ~mask == 0:
+                yield bit
+
+    def table(self):
+        """The number of ways to finish an ordering from each closed set."""
+        if self._ways is None:
+            layers = [[0]]
+            for _ in range(len(self.items)):
+                layer = {}
+                for mask in layers[-1]:
+                    for bit in self._available(mask):
+                        layer[mask | bit] = None
+                if len(layer) == 0:
+                    raise RuntimeError("Orderings have a cycle.")
+                layers.append(list(layer))
+
+            ways = {layers[-1][0]: 1}
+            for layer in reversed(layers[:-1]):
+                for mask in layer:
+                    ways[mask] = sum([ways[mask | bit] for bit in self._available(mask)])
+            self._ways = ways
+        return self._ways
+
+    def count(self):
+        return self.table()[0]
+
+    def sample(self,rng=random):
+        """One ordering, each valid ordering equally likely."""
+        ways = self.table()
+        mask = 0
+        ordering = []
+        for _ in range(len(self.items)):
+            r = rng.randrange(ways[mask])
+            for bit in self._available(mask):
+                r -= ways[mask | bit]
+                if r < 0:
+                    break
+            mask |= bit
+            ordering.append(self.items[bit.bit_length() - 1])
+        return ordering
+
+def read_gate_groups(filename):
+    """The rule names (gate_<group_name>) of the gate groups in a gates CSV."""
+    ###############
+    # header keys #
+    ###############
+    S_CSV_GROUP_NAME = 'group_name'
+
+    groups = []
+    with open(filename,'r',newline='') as csvfile:
+        reader = csv.DictReader(csvfile)
+        if S_CSV_GROUP_NAME not in (reader.fieldnames or []):
+            raise RuntimeError("'%s' required in header of %s." % (S_CSV_GROUP_NAME,filename))
+        for row in reader:
+            name = 'gate_' + row[S_CSV_GROUP_NAME]
+            if row[S_CSV_GROUP_NAME] and name not in groups:
+                groups.append(name)
+    return groups
+
+def main():
+    parser = argparse.ArgumentParser(description="Count and sample the orderings allowed by placement rules.")
+    parser.add_argument("rules", help="Rules file, e.g. gate_rules.txt.", metavar="FILE")
+    parser.add_argument("--gates", "-g", dest="gates", help="Gates CSV, to order its gate groups instead of the parts the rules name.", metavar="FILE")
+    parser.add_argument("--sample", "-n", dest="sample", type=int, default=0, help="Number of orderings to print.", metavar="N")
+    parser.add_argument("--seed", dest="seed", type=int, help="Random seed.", metavar="N")
+    args = parser.parse_args()
+
+    with open(args.rules,'r') as rulesfile:
+        graph = RuleGraph(rulesfile.read().splitlines(),args.rules)
+    graph.check()
+
+    items = read_gate_groups(args.gates) if args.gates else None
+    orderings = Orderings.from_rules(graph,items)
+    print("%d items, %d orderings" % (len(orderings.items),orderings.count()))
+
+    rng = random.Random(args.seed)
+    for _ in range(args.sample):
+        print(' '.join(orderings.sample(rng)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+import re
+import argparse
+from array import array
+
+__author__  = 'Timothy S. Jones <jonests@bu.edu>, Densmore Lab, BU'
+__license__ = 'GPL3'
+
+# Streaming reader for the GenBank files of the measurement plasmid and the
+# genetic locations.
+#
+# parse() takes any iterable of lines and holds only the current feature,
+# so a whole genome is read in one pass with the sequence kept as a list of
+# line pieces until the end. Feature locations (ranges, single bases,
+# complement(), join() and order(), with < and > ends) become 1-based
+# inclusive spans. On a circular record a span across the origin (start
+# after end) is kept as the two spans start..length and 1..end. The spans
+# of every feature are kept in an IntervalIndex:
+# the spans sorted by start in arrays, read as an implicit balanced tree in
+# which each node also holds the greatest end below it, so an overlap query
+# visits O(log n) nodes plus one per span found.
+
+S_LOCUS = 'LOCUS'
+S_FEATURES = 'FEATURES'
+S_ORIGIN = 'ORIGIN'
+S_END = '//'
+
+# the column the feature location and qualifiers start at
+FEATURE_COLUMN = 21
+
+_NOT_SEQUENCE = re.compile(r'[\d\s]')
+_SPAN = re.compile(r'^<?(\d+)(?:(?:\.\.|\^)>?(\d+))?>?$')
+
+def parse_location(text):
+    """A GenBank location as a list of (start, end, strand) spans."""
+    text = text.replace(' ','')
+
+    def spans(text,strand):
+        if text.startswith('complement(') and text.endswith(')'):
+            return [(s,e,-t) for (s,e,t) in reversed(spans(text[11:-1],strand))]
+        for operator in ('join(','order('):
+            if text.startswith(operator) and text.endswith(')'):
+                result = []
+                for part in _split_top(text[len(operator):-1]):
+                    result += spans(part,strand)
+                return result
+        if ':' in text:
+            # a span of another record, which has no place in this one
+            return []
+        m = _SPAN.match(text)
+        if m is None:
+            raise RuntimeError("Invalid location '%s'." % text)
+        start = int(m.group(1))
+        end = int(m.group(2)) if m.group(2) else start
+        return [(start,end,strand)]
+
+    return spans(text,1)
+
+def _split_top(text):
+    # split on the commas outside parentheses
+    parts = []
+    depth = 0
+    last = 0
+    for (i,ch) in enumerate(text):
+        if ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+        elif ch == ',' and depth == 0:
+            parts.append(text[last:i])
+            last = i + 1
+    parts.append(text[last:])
+    return parts
+
+class Feature:
+    __slots__ = ('key','location','spans','qualifiers')
+
+    def __init__(self,key,location):
+        self.key = key
+        self.location = location
+        # a location continued on the next line is parsed once complete
+        self.spans = parse_location(location) if location.count('(') == location.count(')') else []
+        self.qualifiers = []
+
+    # None for a location only in other records, which has no spans here
+
+    @property
+    def start(self):
+        return min(s for (s,_,_) in self.spans) if self.spans else None
+
+    @property
+    def end(self):
+        return max(e for (_,e,_) in self.spans) if self.spans else None
+
+    @property
+    def strand(self):
+        return self.spans[0][2] if self.spans else 1
+
+    @property
+    def label(self):
+        for (key,value) in self.qualifiers:
+            if key in ('label','gene','product','note'):
+                return value
+        return None
+
+    def __repr__(self):
+        return "Feature(%s,%s,%s)" % (self.key,self.location,self.label)
+
+class IntervalIndex:
+    """Static index of closed intervals, each with a value."""
+
+    def __init__(self,intervals):
+        intervals = sorted(intervals,key=lambda i: (i[0],i[1]))
+        self._starts = array('q',[i[0] for i in intervals])
+        self._ends = array('q',[i[1] for i in intervals])
+        self._values = [i[2] for i in intervals]
+        # greatest end in the subtree rooted at each midpoint
+        self._max_ends = array('q',self._ends)
+        self._build(0,len(intervals))
+
+    def _build(self,lo,hi):
+        if lo >= hi:
+            return -1
+        mid = (lo + hi) // 2
+        m = self._ends[mid]
+        for child in (self._build(lo,mid),self._build(mid + 1,hi)):
+            if child >= 0 and self._max_ends[child] > m:
+                m = self._max_ends[child]
+        self._max_ends[mid] = m
+        return mid
+
+    def __len__(self):
+        return len(self._values)
+
+    def overlapping(self,start,end):
+        """The values of the intervals that overlap [start, end]."""
+        found = []
+        stack = [(0,len(self._values))]
+        while stack:
+            (lo,hi) = stack.pop()
+            if lo >= hi:
+                continue
+            mid = (lo + hi) // 2
+            if self._max_ends[mid] < start:
+                # nothing below here reaches start
+                continue
+            stack.append((lo,mid))
+            if self._starts[mid] <= end:
+                if self._ends[mid] >= start:
+                    found.append(self._values[mid])
+                stack.append((mid + 1,hi))
+        return found
+
+class GenBank:
+    def __init__(self):
+        self.name = None
+        self.length = None
+        self.circular = False
+        self.features = []
+        self.sequence = None
+        self._index = None
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = IntervalIndex((s,e,f) for f in self.features for (s,e,_) in f.spans)
+        return self._index
+
+    def overlapping(self,start,end):
+        """The features with a span overlapping the 1-based range [start, end]."""
+        features = []
+        seen = set()
+        for f in self.index.overlapping(start,end):
+            if id(f) not in seen:
+                seen.add(id(f))
+                features.append(f)
+        return features
+
+    def split(self,start,end):
+        """The features that replacing [start, end] would cut through, i.e.
+        with a span crossing either end of the range."""
+        return [f for f in self.overlapping(start - 1,end + 1)
+                if any(s < start <= e or s <= end < e for (s,e,_) in f.spans)]
+
+def parse(lines,filename='<genbank>',sequence=True):
+    """Read one GenBank record from lines; with sequence=False only the
+    length of the ORIGIN sequence is kept."""
+    record = GenBank()
+    section = None
+    feature = None
+    pieces = []
+    length = 0
+
+    for (n,line) in enumerate(lines,1):
+        line = line.rstrip('\r\n')
+        if section == S_ORIGIN and line[:1] == ' ':
+            piece = _NOT_SEQUENCE.sub('',line)
+            length += len(piece)
+            if sequence:
+                pieces.append(piece)
+            continue
+        if line.startswith(S_END):
+            break
+        if line[:1] not in (' ',''):
+            # a new top-level keyword
+            keyword = line.split(None,1)[0]
+            section = keyword
+            if keyword == S_LOCUS:
+                words = line.split()
+                if len(words) > 1:
+                    record.name = words[1]
+                for (i,word) in enumerate(words):
+                    if word in ('bp','aa') and i > 0 and words[i - 1].isdigit():
+                        record.length = int(words[i - 1])
+                record.circular = 'circular' in words
+            continue
+        if section != S_FEATURES or len(line.strip()) == 0:
+            continue
+        try:
+            if line[5:FEATURE_COLUMN].strip():
+                feature = Feature(line[5:FEATURE_COLUMN].strip(),line[FEATURE_COLUMN:].strip())
+                record.features.append(feature)
+            elif feature is not None:
+                text = line[FEATURE_COLUMN:].strip()
+                if text.startswith('/'):
+                    (key,_,value) = text[1:].partition('=')
+                    feature.qualifiers.append((key,value.strip('"')))
+                elif len(feature.qualifiers) == 0:
+                    # a location continued on the next line
+                    feature.location += text
+                    if feature.location.count('(') == feature.location.count(')'):
+                        feature.spans = parse_location(feature.location)
+                else:
+                    (key,value) = feature.qualifiers[-1]
+                    feature.qualifiers[-1] = (key,value + ' ' + text.strip('"'))
+        except RuntimeError as e:
+            raise RuntimeError("%s line %d: %s" % (filename,n,e))
+
+    if section != S_ORIGIN and record.length is None:
+        raise RuntimeError("No sequence length in %s." % filename)
+    if section == S_ORIGIN or length > 0:
+        if record.length is not None and record.length != length:
+            raise RuntimeError("%s: LOCUS length %d but ORIGIN has %d bp." % (filename,record.length,length))
+        record.length = length
+    if sequence and pieces:
+        record.sequence = ''.join(pieces)
+
+    for f in record.features:
+        spans = []
+        for (start,end,strand) in f.spans:
+            if start < 1 or end > record.length or start > record.length or (start > end and not record.circular):
+                raise RuntimeError("%s: %s location '%s' outside the %d bp sequence."
+                                   % (filename,f.key,f.location,record.length))
+            if start > end:
+                # across the origin, in the order of the strand
+                pieces = [(start,record.length,strand),(1,end,strand)]
+                spans += pieces if strand > 0 else pieces[::-1]
+            else:
+                spans.append((start,end,strand))
+        f.spans = spans
+    return record
+
+def read(filename,sequence=True):
+    with open(filename,'r') as gbfile:
+        return parse(gbfile,filename,sequence)
+
+def main():
+    parser = argparse.ArgumentParser(description="List the features of a GenBank file, or those overlapping a range.")
+    parser.add_argument("genbank", help="GenBank file.", metavar="FILE")
+    parser.add_argument("--overlaps", dest="overlaps", type=int, nargs=2, help="1-based bp range.", metavar=("START","END"))
+    args = parser.parse_args()
+
+    record = read(args.genbank,sequence=False)
+    print("%s %d bp %s" % (record.name,record.length,'circular' if record.circular else 'linear'))
+    features = record.features
+    if args.overlaps:
+        features = record.overlapping(*args.overlaps)
+    for f in sorted((f for f in features if f.spans),key=lambda f: (f.start,f.end)):
+        print("%8d %8d %s %-14s %s" % (f.start,f.end,'+' if f.strand > 0 else '-',f.key,f.label or ''))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+import sys
+import csv
+import json
+import argparse
+import warnings
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy
+
+import ucf_stream
+import response_kernels
+
+__author__  = 'Timothy S. Jones <jonests@bu.edu>, Densmore Lab, BU'
+__license__ = 'GPL3'
+
+# Rank the cross-coupled pairs of gates of a UCF by bistability.
+#
+# A pair latches through y = f1(x) and x = f2(y). Both curves are taken to
+# log-log space and sampled along the lines v = log y - log x, on which a
+# curve whose log-log slope is below 1 (every repressor) has exactly one
+# point, so each gate is reduced once to log x as a function of v, as the
+# first gate (lxA) and as the second (lxB). For a pair the separation
+# s(v) = lxA(v) - lxB(v) then says everything:
+#
+# - its zeros are the fixed points, stable where s falls through zero
+#   (loop gain below 1) and unstable where it rises;
+# - between two fixed points |s(v)| is the side, in decades, of the square
+#   with opposite corners on the two curves, so the largest |s| over a lobe
+#   of the butterfly is its static noise margin.
+#
+# s is computed on one shared grid of v for blocks of pairs at once, as a
+# (rows, columns, points) array, optionally in several processes. Pairs of
+# gates in the same group are skipped, as in latch_triangle.py.
+
+POINTS = 512
+BLOCK_ELEMENTS = 1 << 23
+
+S_UCF_GATE_NAME = 'gate_name'
+S_UCF_GROUP_NAME = 'group_name'
+
+COLUMNS = ['gate_1','gate_2','fixed_points','stable','noise_margin_1','noise_margin_2','score',
+           'x_1','y_1','x_2','y_2']
+
+class LatchScreen:
+    """The pairs of a list of response_functions collections."""
+
+    def __init__(self,collections,groups=None,points=POINTS,cache_dir=response_kernels.CACHE_DIR):
+        functions = response_kernels.ResponseFunctions(collections,cache_dir)
+        groups = groups if groups is not None else {}
+
+        # the range of every output, and a grid of x wide enough that every
+        # curve spans the same range of v
+        probe = functions(numpy.logspace(-8,8,4 * points))
+        valid = numpy.all(probe > 0,axis=1) & numpy.all(numpy.isfinite(probe),axis=1)
+        with numpy.errstate(divide='ignore',invalid='ignore'):
+            lprobe = numpy.log10(probe[valid])
+        if len(lprobe) == 0:
+            (lmin,lmax) = (0.0,0.0)
+        else:
+            (lmin,lmax) = (lprobe.min(),lprobe.max())
+        width = lmax - lmin + 1
+        lx = numpy.linspace(lmin - width,lmax + width,4 * points)
+        with numpy.errstate(divide='ignore',invalid='ignore'):
+            lf = numpy.log10(functions(10 ** lx))
+
+        # v = log y - log x must fall along each curve
+        va = lf - lx
+        valid &= numpy.all(numpy.isfinite(lf),axis=1) & numpy.all(numpy.diff(va,axis=1) < 0,axis=1)
+        for (name,ok) in zip(functions.gate_names,valid):
+            if not ok:
+                warnings.warn("Gate '%s' skipped, its response function is not positive with log-log slope below 1." % name,RuntimeWarning)
+
+        index = numpy.flatnonzero(valid)
+        self.gate_names = [functions.gate_names[i] for i in index]
+        self.groups = [groups.get(name,name) for name in self.gate_names]
+        va = va[index]
+        lf = lf[index]
+        if len(index) > 0:
+            # the range of v both ways round, lxa over va and lxb over -va
+            self.v = numpy.linspace(max(va[:,-1].max(),-va[:,0].min()),min(va[:,0].min(),-va[:,-1].max()),points)
+        else:
+            self.v = numpy.zeros(points)
+        # log x of each gate on the grid of v, as y = f1(x) and as x = f2(y)
+        self.lxa = numpy.array([numpy.interp(self.v,va[g,::-1],lx[::-1]) for g in range(len(index))]).reshape(-1,points)
+        self.lxb = numpy.array([numpy.interp(self.v,-va[g],lf[g]) for g in range(len(index))]).reshape(-1,points)
+        codes = {}
+        self._group = numpy.array([codes.setdefault(g,len(codes)) for g in self.groups],dtype=numpy.intp)
+
+    def __len__(self):
+        return len(self.gate_names)
+
+    def blocks(self):
+        """The row ranges of the pairs, each small enough for one array."""
+        n = len(self.gate_names)
+        rows = max(1,BLOCK_ELEMENTS // max(1,n * len(self.v)))
+        return [(a,min(a + rows,n)) for a in range(0,n,rows)]
+
+    def block(self,a,b):
+        """The pairs (i, j) of rows a..b-1 and every later gate j, as a dict
+        of arrays of the COLUMNS without the gate names."""
+        n = len(self.gate_names)
+        m = len(self.v)
+        (i,j) = numpy.meshgrid(numpy.arange(a,b),numpy.arange(a + 1,n),indexing='ij')
+        keep = (j > i) & (self._group[i] != self._group[j])
+
+        s = self.lxa[a:b,None,:] - self.lxb[None,a + 1:,:]
+        positive = s > 0
+        change = positive[:,:,1:] != positive[:,:,:-1]
+        fixed = change.sum(axis=2)
+        stable = (positive[:,:,:-1] & ~positive[:,:,1:]).sum(axis=2)
+
+        result = {'i': i[keep],'j': j[keep],'fixed_points': fixed[keep],'stable': stable[keep]}
+        k = len(result['i'])
+        for key in COLUMNS[4:]:
+            result[key] = numpy.zeros(k) if key.startswith('noise') or key == 'score' else numpy.full(k,numpy.nan)
+
+        bistable = numpy.flatnonzero(result['stable'] >= 2)
+        if len(bistable) > 0:
+            (bi,bj) = (result['i'][bistable],result['j'][bistable])
+            sb = s[bi - a,bj - a - 1]
+            cb = change[bi - a,bj - a - 1]
+            fb = result['fixed_points'][bistable]
+            # the lobes lie between consecutive fixed points
+            segment = numpy.zeros(sb.shape,dtype=numpy.intp)
+            segment[:,1:] = numpy.cumsum(cb,axis=1)
+            margins = numpy.full((len(bistable),fb.max() - 1),numpy.inf)
+            for lobe in range(1,fb.max()):
+                inside = numpy.where(segment == lobe,numpy.abs(sb),0).max(axis=1)
+                margins[:,lobe - 1] = numpy.where(lobe < fb,inside,numpy.inf)
+            result['noise_margin_1'][bistable] = margins[:,0]
+            result['noise_margin_2'][bistable] = margins[numpy.arange(len(bistable)),fb - 2]
+            result['score'][bistable] = margins.min(axis=1)
+
+            # the outer stable states, the first and last fixed points
+            rows = numpy.arange(len(bistable))
+            for (c,keys) in ((numpy.argmax(cb,axis=1),('x_1','y_1')),
+                             (m - 2 - numpy.argmax(cb[:,::-1],axis=1),('x_2','y_2'))):
+                t = sb[rows,c] / (sb[rows,c] - sb[rows,c + 1])
+                lv = self.v[c] + t * (self.v[c + 1] - self.v[c])
+                lx = self.lxa[bi,c] + t * (self.lxa[bi,c + 1] - self.lxa[bi,c])
+                result[keys[0]][bistable] = 10 ** lx
+                result[keys[1]][bistable] = 10 ** (lx + lv)
+        return result
+
+    def screen(self,jobs=1):
+        """Every pair, ranked by score, as a dict of arrays."""
+        blocks = self.blocks()
+        if jobs > 1 and len(blocks) > 1 and 'fork' in multiprocessing.get_all_start_methods():
+            global _screen
+            _screen = self
+            with ProcessPoolExecutor(max_workers=jobs,mp_context=multiprocessing.get_context('fork')) as executor:
+                results = list(executor.map(_block,blocks))
+        else:
+            results = [self.block(a,b) for (a,b) in blocks]
+
+        pairs = {key: numpy.concatenate([r[key] for r in results]) if results else numpy.zeros(0)
+                 for key in ['i','j'] + COLUMNS[2:]}
+        order = numpy.lexsort((pairs['j'],pairs['i'],-pairs['score']))
+        return {key: values[order] for (key,values) in pairs.items()}
+
+    def rows(self,pairs):
+        """The ranked pairs as dicts of the COLUMNS."""
+        columns = {key: pairs[key].tolist() for key in COLUMNS[2:]}
+        rows = []
+        for (n,(i,j)) in enumerate(zip(pairs['i'].tolist(),pairs['j'].tolist())):
+            row = {'gate_1': self.gate_names[i],'gate_2': self.gate_names[j]}
+            for (key,values) in columns.items():
+                row[key] = values[n]
+            rows.append(row)
+        return rows
+
+# the screen of the current run, shared with forked workers
+_screen = None
+
+def _block(rows):
+    return _screen.block(*rows)
+
+def read_screen(filename,gates=None,points=POINTS,cache_dir=response_kernels.CACHE_DIR):
+    """The LatchScreen of the response functions of a UCF file."""
+    ucf = ucf_stream.load(filename,['response_functions','gates'])
+    collections = ucf.collections('response_functions')
+    if gates:
+        missing = set(gates) - set(c[S_UCF_GATE_NAME] for c in collections)
+        if missing:
+            raise RuntimeError("No response function for gates %s." % ', '.join(sorted(missing)))
+        collections = [c for c in collections if c[S_UCF_GATE_NAME] in gates]
+    groups = {g[S_UCF_GATE_NAME]: g[S_UCF_GROUP_NAME] for g in ucf.collections('gates') if S_UCF_GROUP_NAME in g}
+    return LatchScreen(collections,groups,points,cache_dir)
+
+def main():
+    parser = argparse.ArgumentParser(description="Rank the cross-coupled gate pairs of a UCF by bistability.")
+    parser.add_argument("ucf", help="UCF file.", metavar="FILE")
+    parser.add_argument("--gates", "-g", nargs='+', help="Only pair these gates.", metavar="GATE")
+    parser.add_argument("--points", "-m", type=int, default=POINTS, help="Points of the shared grid (default %d)." % POINTS, metavar="N")
+    parser.add_argument("--jobs", "-j", type=int, default=1, help="Screen blocks of pairs in N processes.", metavar="N")
+    parser.add_argument("--bistable", "-b", action='store_true', help="Only list the bistable pairs.")
+    parser.add_argument("--top", "-n", type=int, help="Only list the N best pairs.", metavar="N")
+    parser.add_argument("--format", "-f", choices=['csv','json'], default='csv', help="Output format.")
+    parser.add_argument("--outfile", help="Write the table to this file instead of standard output.", metavar="FILE")
+    parser.add_argument("--cache-dir", dest="cache_dir", default=response_kernels.CACHE_DIR, help="Cache of compiled response functions.", metavar="DIR")
+    args = parser.parse_args()
+    if args.points < 3:
+        parser.error("--points must be at least 3.")
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1.")
+
+    screen = read_screen(args.ucf,args.gates,args.points,args.cache_dir)
+    pairs = screen.screen(args.jobs)
+    sys.stderr.write("%d gates, %d pairs, %d bistable\n" % (len(screen),len(pairs['i']),(pairs['stable'] >= 2).sum()))
+    if args.bistable:
+        bistable = pairs['stable'] >= 2
+        pairs = {key: values[bistable] for (key,values) in pairs.items()}
+    if args.top is not None:
+        pairs = {key: values[:args.top] for (key,values) in pairs.items()}
+    rows = screen.rows(pairs)
+
+    outfile = open(args.outfile,'w',newline='') if args.outfile else sys.stdout
+    if args.format == 'json':
+        # NaN, for the states of a pair that is not bistable, is written as null
+        json.dump([{k: None if v != v else v for (k,v) in row.items()} for row in rows],outfile,indent=2)
+        outfile.write('\n')
+    else:
+        writer = csv.DictWriter(outfile,COLUMNS,lineterminator='\n')
+        writer.writeheader()
+        writer.writerows(rows)
+    if args.outfile:
+        outfile.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import io
+import json
+import zlib
+import struct
+import argparse
+
+__author__  = 'Timothy S. Jones <jonests@bu.edu>, Densmore Lab, BU'
+__license__ = 'GPL3'
+
+# External storage for the sequences of genetic locations.
+#
+# The sequences are cut into fixed-size chunks (64 kbp by default) that are
+# zlib-compressed one by one, so reading a bp range only decompresses the
+# chunks it touches. The file is
+#
+#   MAGIC | chunk | chunk | ... | JSON index | index offset (<Q)
+#
+# where the index maps each location name to its length, whether it is
+# circular and the (offset, size) of its chunks. A range of a circular
+# location may run across the origin, start..length then 1..end.
+# ucf_builder --location-store replaces the ORIGIN
+# lines of each genetic_locations file with a reference
+# {"store": FILE, "location": NAME, "length": BP} to such a file.
+
+MAGIC = b'UCFLOC1\n'
+CHUNK_SIZE = 1 << 16
+
+S_STORE = 'store'
+S_LOCATION = 'location'
+S_LENGTH = 'length'
+
+class LocationStoreWriter:
+    def __init__(self,filename,name=None,chunk_size=CHUNK_SIZE,level=6):
+        self._file = open(filename,'wb')
+        self._file.write(MAGIC)
+        self._offset = len(MAGIC)
+        self._name = filename if name is None else name
+        self._chunk_size = chunk_size
+        self._level = level
+        self._locations = {}
+
+    def add(self,location,sequence,circular=False):
+        """Store a sequence and return the reference to it."""
+        if location in self._locations:
+            raise RuntimeError("Location '%s' already stored." % location)
+        chunks = []
+        for start in range(0,len(sequence),self._chunk_size):
+            data = zlib.compress(sequence[start:start + self._chunk_size].encode('ascii'),self._level)
+            self._file.write(data)
+            chunks.append([self._offset,len(data)])
+            self._offset += len(data)
+        self._locations[location] = {S_LENGTH: len(sequence),'circular': circular,'chunks': chunks}
+        return {S_STORE: self._name,S_LOCATION: location,S_LENGTH: len(sequence)}
+
+    def close(self):
+        index = json.dumps({'chunk_size': self._chunk_size,'locations': self._locations}).encode()
+        self._file.write(index)
+        self._file.write(struct.pack('<Q',self._offset))
+        self._file.close()
+
+class LocationStore:
+    """Random access to the sequences of a location store file."""
+
+    def __init__(self,filename,cache_chunks=8):
+        self._file = open(filename,'rb')
+        if self._file.read(len(MAGIC)) != MAGIC:
+            raise RuntimeError("%s is not a location store." % filename)
+        self._file.seek(-8,io.SEEK_END)
+        end = self._file.tell()
+        (offset,) = struct.unpack('<Q',self._file.read(8))
+        self._file.seek(offset)
+        index = json.loads(self._file.read(end - offset))
+        self.chunk_size = index['chunk_size']
+        self._locations = index['locations']
+        # the most recently used decompressed chunks, oldest first
+        self._cache = {}
+        self._cache_chunks = cache_chunks
+
+    def close(self):
+        self._file.close()
+
+    @property
+    def locations(self):
+        return list(self._locations)
+
+    def length(self,location):
+        return self._location(location)[S_LENGTH]
+
+    def circular(self,location):
+        return self._location(location).get('circular',False)
+
+    def _location(self,location):
+        if location not in self._locations:
+            raise RuntimeError("Location '%s' not in the store." % location)
+        return self._locations[location]
+
+    def _chunk(self,location,i):
+        key = (location,i)
+        data = self._cache.pop(key,None)
+        if data is None:
+            (offset,size) = self._locations[location]['chunks'][i]
+            self._file.seek(offset)
+            data = zlib.decompress(self._file.read(size)).decode('ascii')
+            if len(self._cache) >= self._cache_chunks:
+                del self._cache[next(iter(self._cache))]
+        self._cache[key] = data
+        return data
+
+    def read(self,location,start=1,end=None):
+        """The bases start..end, 1-based and inclusive like bp_start/bp_end;
+        on a circular location start may be after end."""
+        length = self.length(location)
+        if end is None:
+            end = length
+        if start < 1 or end > length or start > length + 1 or (start > end + 1 and not self.circular(location)):
+            raise RuntimeError("Range %d..%d outside the %d bp of '%s'." % (start,end,length,location))
+        if start > end + 1:
+            # across the origin
+            return self.read(location,start,length) + self.read(location,1,end)
+        first = (start - 1) // self.chunk_size
+        last = (end - 1) // self.chunk_size
+        pieces = [self._chunk(location,i) for i in range(first,last + 1)]
+        skip = (start - 1) - first * self.chunk_size
+        return ''.join(pieces)[skip:skip + end - start + 1]
+
+def main():
+    parser = argparse.ArgumentParser(description="Print a bp range of a location in a location store.")
+    parser.add_argument("store", help="Location store file.", metavar="FILE")
+    parser.add_argument("location", nargs='?', help="Location name; lists the locations when omitted.")
+    parser.add_argument("--range", "-r", dest="range", type=int, nargs=2, help="1-based inclusive bp range.", metavar=("START","END"))
+    args = parser.parse_args()
+
+    store = LocationStore(args.store)
+    if args.location is None:
+        for location in store.locations:
+            print("%s %d" % (location,store.length(location)))
+    elif args.range:
+        print(store.read(args.location,*args.range))
+    else:
+        print(store.read(args.location))
+    store.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,406 @@
+import os
+import re
+import json
+import hashlib
+import argparse
+
+__author__  = 'Timothy S. Jones <jonests@bu.edu>, Densmore Lab, BU'
+__license__ = 'GPL3'
+
+# Motif libraries: parsing, canonicalization and deduplication.
+#
+# A motif is a {"inputs","outputs","netlist","collection"} record whose
+# netlist holds gate strings such as "NOR(n4,0Wire44,0Wire45)", output wire
+# first. Internal wire names (n4, 0Wire44, ...) are arbitrary, so each
+# wire is given a structural hash built from its gate type and the hashes
+# of its inputs (sorted for the commutative gates). The motif digest covers
+# the inputs, the outputs and the hashes of every gate, so two motifs have
+# the same digest exactly when they differ only by internal wire names and
+# gate order. The canonical netlist lists the gates in a fixed order with
+# the internal wires renamed w0, w1, ...
+#
+# Any other keys of a motif record are kept with the motif, and records of
+# another collection type are kept as they are, in their place in the file.
+#
+# MotifLibrary.load() caches the parsed, deduplicated index next to the
+# source file, keyed by the source's SHA-256, so later loads skip parsing.
+#
+# Truth tables are integer bitsets: bit r of an output's table is its value
+# for input combination r, where the first input is the most significant bit
+# of r. Each input is a constant mask (a = 0xF0 for three inputs) and each
+# gate is one integer operation, so a netlist is evaluated over every input
+# combination in a single pass. FunctionIndex maps the tables to the motifs
+# implementing them, e.g. the 3-input majority function is 0xE8.
+
+S_UCF_COLLECTION = 'collection'
+S_UCF_MOTIF_LIBRARY = 'motif_library'
+S_UCF_INPUTS = 'inputs'
+S_UCF_OUTPUTS = 'outputs'
+S_UCF_NETLIST = 'netlist'
+
+COMMUTATIVE = set(['NOR','OR','OUTPUT_OR','AND','NAND','XOR','XNOR'])
+
+INDEX_VERSION = 2
+
+_GATE = re.compile(r'^\s*([A-Za-z_][A-Za-z0-9_]*)\s*\((.*)\)\s*$')
+
+def parse_gate(text):
+    """Parse 'TYPE(out,in1,...)' into (TYPE, out, (in1,...))."""
+    m = _GATE.match(text)
+    if m is None:
+        raise RuntimeError("Invalid netlist entry '%s'." % text)
+    wires = [w.strip() for w in m.group(2).split(',')]
+    if len(wires) < 2 or any(len(w) == 0 for w in wires):
+        raise RuntimeError("Invalid netlist entry '%s'." % text)
+    return (m.group(1),wires[0],tuple(wires[1:]))
+
+_MASKS = {}
+
+def input_masks(n):
+    """The truth tables of n inputs, first input most significant."""
+    masks = _MASKS.get(n)
+    if masks is None:
+        rows = 1 << n
+        masks = []
+        for i in range(n):
+            # blocks of 2^k zeros then 2^k ones, k counting up from the last input
+            k = 1 << (n - 1 - i)
+            block = ((1 << k) - 1) << k
+            mask = 0
+            for start in range(0,rows,2 * k):
+                mask |= block << start
+            masks.append(mask)
+        masks = tuple(masks)
+        _MASKS[n] = masks
+    return masks
+
+def evaluate(gates,inputs,outputs):
+    """Truth tables of the outputs of topologically ordered gates."""
+    full = (1 << (1 << len(inputs))) - 1
+    values = dict(zip(inputs,input_masks(len(inputs))))
+    for (gate_type,out,ins) in gates:
+        if gate_type == 'NOT':
+            v = values[ins[0]] ^ full
+        elif gate_type == 'NOR' or gate_type == 'OR' or gate_type == 'OUTPUT_OR':
+            v = 0
+            for w in ins:
+                v |= values[w]
+            if gate_type == 'NOR':
+                v ^= full
+        elif gate_type == 'BUF':
+            v = values[ins[0]]
+        elif gate_type == 'AND' or gate_type == 'NAND':
+            v = full
+            for w in ins:
+                v &= values[w]
+            if gate_type == 'NAND':
+                v ^= full
+        elif gate_type == 'XOR' or gate_type == 'XNOR':
+            v = 0
+            for w in ins:
+                v ^= values[w]
+            if gate_type == 'XNOR':
+                v ^= full
+        else:
+            raise RuntimeError("Unknown gate type '%s'." % gate_type)
+        values[out] = v
+    return tuple(values[w] for w in outputs)
+
+def _split_gate(text):
+    # canonical netlists are generated, so need no validation
+    i = text.index('(')
+    wires = text[i + 1:-1].split(',')
+    return (text[:i],wires[0],wires[1:])
+
+def _digest(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+class Motif:
+    __slots__ = ('inputs','outputs','netlist','gates','digest','canonical','extra')
+
+    KEYS = (S_UCF_INPUTS,S_UCF_OUTPUTS,S_UCF_NETLIST,S_UCF_COLLECTION)
+
+    def __init__(self,inputs,outputs,netlist,extra=None):
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.netlist = list(netlist)
+        self.extra = extra if extra is not None else {}
+        self.gates = [parse_gate(g) for g in self.netlist]
+        self.digest, self.canonical = self._canonicalize()
+
+    @classmethod
+    def from_dict(cls,collection):
+        return cls(collection[S_UCF_INPUTS],collection[S_UCF_OUTPUTS],collection[S_UCF_NETLIST],
+                   {k: v for (k,v) in collection.items() if k not in cls.KEYS})
+
+    @property
+    def size(self):
+        return len(self.netlist)
+
+    def truth_tables(self):
+        """One bitset per output, see input_masks()."""
+        # the canonical netlist is in topological order
+        return evaluate([_split_gate(g) for g in self.canonical],self.inputs,self.outputs)
+
+    def as_dict(self):
+        # the key order of std-motif.json
+        d = {S_UCF_OUTPUTS: self.outputs,
+             S_UCF_INPUTS: self.inputs,
+             S_UCF_NETLIST: self.netlist,
+             S_UCF_COLLECTION: S_UCF_MOTIF_LIBRARY}
+        d.update(self.extra)
+        return d
+
+    def _canonicalize(self):
+        drivers = {}
+        for gate in self.gates:
+            if gate[1] in drivers:
+                raise RuntimeError("Wire '%s' driven more than once." % gate[1])
+            drivers[gate[1]] = gate
+
+        inputs = set(self.inputs)
+        outputs = set(self.outputs)
+        hashes = {}
+        visiting = set()
+
+        def wire_hash(wire):
+            h = hashes.get(wire)
+            if h is not None:
+                return h
+            if wire in inputs:
+                h = _digest('in:' + wire)
+            else:
+                gate = drivers.get(wire)
+                if gate is None:
+                    raise RuntimeError("Wire '%s' has no driver." % wire)
+                if wire in visiting:
+                    raise RuntimeError("Netlist has a cycle through '%s'." % wire)
+                visiting.add(wire)
+                children = [wire_hash(w) for w in gate[2]]
+                visiting.discard(wire)
+                if gate[0] in COMMUTATIVE:
+                    children.sort()
+                h = _digest(gate[0] + '(' + ','.join(children) + ')')
+            # outputs keep their names, so they are part of the structure
+            if wire in outputs:
+                h = _digest('out:' + wire + ':' + h)
+            hashes[wire] = h
+            return h
+
+        for gate in self.gates:
+            wire_hash(gate[1])
+
+        digest = _digest(json.dumps([self.inputs,self.outputs,
+                                     sorted(hashes[g[1]] for g in self.gates)]))
+
+        # canonical netlist: depth-first from the outputs, inputs of each
+        # gate visited in hash order, then any gates no output depends on
+        order = []
+        seen = set()
+
+        def visit(wire):
+            if wire in seen or wire not in drivers:
+                return
+            seen.add(wire)
+            gate = drivers[wire]
+            for w in sorted(gate[2],key=lambda w: hashes.get(w,'')) if gate[0] in COMMUTATIVE else gate[2]:
+                visit(w)
+            order.append(gate)
+
+        for wire in self.outputs:
+            visit(wire)
+        for wire in sorted((g[1] for g in self.gates),key=lambda w: hashes[w]):
+            visit(wire)
+
+        names = {w: w for w in self.inputs + self.outputs}
+        for gate in order:
+            if gate[1] not in names:
+                names[gate[1]] = 'w%d' % (len(names) - len(self.inputs) - len(self.outputs))
+
+        canonical = []
+        for (gate_type,out,ins) in order:
+            ins = [names[w] for w in ins]
+            if gate_type in COMMUTATIVE:
+                ins = sorted(ins)
+            canonical.append("%s(%s)" % (gate_type,','.join([names[out]] + ins)))
+        return digest, canonical
+
+class MotifLibrary:
+    """Deduplicated motif library indexed by structural digest.
+
+    Motifs keep the order of their first occurrence, and the record of the
+    first occurrence is the one kept. Records that are not motifs are kept
+    in others, and in their place among the motifs in collections().
+    """
+
+    def __init__(self,motifs=()):
+        self.motifs = []
+        self.others = []
+        self._records = []
+        self._by_digest = {}
+        self.duplicates = 0
+        for motif in motifs:
+            self.add(motif)
+
+    def add(self,motif):
+        if motif.digest in self._by_digest:
+            self.duplicates += 1
+            return False
+        self._by_digest[motif.digest] = motif
+        self.motifs.append(motif)
+        self._records.append(motif)
+        return True
+
+    def add_other(self,record):
+        """Keep a record of another collection type as it is."""
+        self.others.append(record)
+        self._records.append(record)
+
+    def __len__(self):
+        return len(self.motifs)
+
+    def __iter__(self):
+        return iter(self.motifs)
+
+    def __contains__(self,digest):
+        return digest in self._by_digest
+
+    def get(self,digest):
+        return self._by_digest.get(digest)
+
+    def collections(self):
+        return [r.as_dict() if isinstance(r,Motif) else r for r in self._records]
+
+    def function_index(self):
+        return FunctionIndex(self.motifs)
+
+    @classmethod
+    def parse(cls,filename):
+        with open(filename,'r') as jsonfile:
+            records = json.load(jsonfile)
+        library = cls()
+        for record in records:
+            if record.get(S_UCF_COLLECTION,S_UCF_MOTIF_LIBRARY) != S_UCF_MOTIF_LIBRARY:
+                library.add_other(record)
+                continue
+            try:
+                library.add(Motif.from_dict(record))
+            except RuntimeError as e:
+                raise RuntimeError("%s: %s" % (filename,e))
+        return library
+
+    @classmethod
+    def load(cls,filename,cache=True):
+        """Parse a motif library JSON file, or load its cached index."""
+        if not cache:
+            return cls.parse(filename)
+
+        with open(filename,'rb') as f:
+            source = hashlib.sha256(f.read()).hexdigest()
+        index_file = filename + '.index'
+        try:
+            with open(index_file,'r') as jsonfile:
+                index = json.load(jsonfile)
+            if index['version'] == INDEX_VERSION and index['source'] == source:
+                return cls._from_index(index)
+        except (OSError,ValueError,KeyError):
+            pass
+
+        library = cls.parse(filename)
+        index = {'version': INDEX_VERSION,
+                 'source': source,
+                 'duplicates': library.duplicates,
+                 # a motif as a list, any other record as itself
+                 'records': [[r.digest,r.inputs,r.outputs,r.netlist,r.canonical,r.extra] if isinstance(r,Motif) else r
+                             for r in library._records]}
+        try:
+            tmp_file = "%s.%d.tmp" % (index_file,os.getpid())
+            with open(tmp_file,'w') as jsonfile:
+                json.dump(index,jsonfile)
+            os.replace(tmp_file,index_file)
+        except OSError:
+            # e.g. a read-only library directory, the cache is optional
+            pass
+        return library
+
+    @classmethod
+    def _from_index(cls,index):
+        library = cls()
+        library.duplicates = index['duplicates']
+        for record in index['records']:
+            if not isinstance(record,list):
+                library.add_other(record)
+                continue
+            (digest,inputs,outputs,netlist,canonical,extra) = record
+            motif = Motif.__new__(Motif)
+            motif.inputs = inputs
+            motif.outputs = outputs
+            motif.netlist = netlist
+            motif.extra = extra
+            motif.gates = None
+            motif.digest = digest
+            motif.canonical = canonical
+            library._by_digest[digest] = motif
+            library.motifs.append(motif)
+            library._records.append(motif)
+        return library
+
+class FunctionIndex:
+    """Motifs by (number of inputs, output truth tables), smallest first."""
+
+    def __init__(self,motifs=()):
+        self._motifs = {}
+        for motif in motifs:
+            self.add(motif)
+        self._sorted = False
+
+    def add(self,motif):
+        key = (len(motif.inputs),motif.truth_tables())
+        self._motifs.setdefault(key,[]).append(motif)
+        self._sorted = False
+
+    def _sort(self):
+        if not self._sorted:
+            for motifs in self._motifs.values():
+                motifs.sort(key=lambda m: m.size)
+            self._sorted = True
+
+    def lookup(self,tables,inputs):
+        """Every motif with the given number of inputs implementing tables.
+
+        tables is one truth table, or a tuple of one per output.
+        """
+        self._sort()
+        if isinstance(tables,int):
+            tables = (tables,)
+        return list(self._motifs.get((inputs,tuple(tables)),[]))
+
+    def smallest(self,tables,inputs):
+        """The motifs of lookup() with the fewest gates."""
+        motifs = self.lookup(tables,inputs)
+        return [m for m in motifs if m.size == motifs[0].size]
+
+    def functions(self):
+        return list(self._motifs.keys())
+
+    def __len__(self):
+        return len(self._motifs)
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the motifs of a library implementing a function.")
+    parser.add_argument("library", help="Motif library JSON file.", metavar="FILE")
+    parser.add_argument("--function", "-f", dest="function", required=True, nargs='+', help="Truth table of each output, e.g. 0xE8.", metavar="TABLE")
+    parser.add_argument("--inputs", "-i", dest="inputs", type=int, required=True, help="Number of inputs.", metavar="N")
+    parser.add_argument("--all", dest="all", action='store_true', help="List every implementation, not only the smallest.")
+    args = parser.parse_args()
+
+    index = MotifLibrary.load(args.library).function_index()
+    tables = tuple(int(t,0) for t in args.function)
+    motifs = index.lookup(tables,args.inputs) if args.all else index.smallest(tables,args.inputs)
+    for motif in motifs:
+        print("%s %s" % (motif.digest[:12],' '.join(motif.canonical)))
+    if len(motifs) == 0:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
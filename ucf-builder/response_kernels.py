@@ -0,0 +1,165 @@
+import os
+import json
+import hashlib
+import functools
+import numpy
+
+__author__  = 'Timothy S. Jones <jonests@bu.edu>, Densmore Lab, BU'
+__license__ = 'GPL3'
+
+# NumPy evaluation of the response_functions of a UCF.
+#
+# Almost every gate uses the Hill form ymin+(ymax-ymin)/(1.0+(x/K)^n), so
+# those gates are held as four parameter arrays and evaluated together as
+# one (gates x points) array expression. Any other equation is parsed with
+# sympy, its parameters substituted, and reduced to an expression tree of
+# plain JSON data: a number, ["x"] for the variable, or [OP, ARG, ...] for
+# one of the operations in OPERATIONS. The tree is cached on disk under
+# the SHA-256 of the equation and parameters, so sympy is only imported the
+# first time an equation is seen. A cached tree is checked node by node
+# before use and is only ever interpreted, never executed as code.
+
+HILL = 'ymin+(ymax-ymin)/(1.0+(x/K)^n)'
+HILL_PARAMETERS = ('ymin','ymax','K','n')
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'),'.cache','ucf_kernels')
+CACHE_VERSION = 2
+
+S_VARIABLE = 'x'
+
+# each operation, by name, as its number of arguments (None for any) and
+# its NumPy implementation over the list of evaluated arguments
+OPERATIONS = {'add': (None,lambda args: functools.reduce(numpy.add,args)),
+              'mul': (None,lambda args: functools.reduce(numpy.multiply,args)),
+              'pow': (2,lambda args: numpy.power(*args)),
+              'exp': (1,lambda args: numpy.exp(*args)),
+              'log': (1,lambda args: numpy.log(*args)),
+              'abs': (1,lambda args: numpy.abs(*args)),
+              'sin': (1,lambda args: numpy.sin(*args)),
+              'cos': (1,lambda args: numpy.cos(*args)),
+              'tanh': (1,lambda args: numpy.tanh(*args))}
+
+def parameters(collection):
+    """The parameters of a response function, by name."""
+    return {p['name']: p['value'] for p in collection['parameters']}
+
+def is_hill(equation,params):
+    return equation.replace(' ','').replace('**','^') == HILL and all(p in params for p in HILL_PARAMETERS)
+
+def kernel_key(equation,params):
+    return hashlib.sha256(json.dumps([equation,sorted(params.items())]).encode()).hexdigest()
+
+def _expression_tree(expr,equation):
+    # the tree of a sympy expression in its one variable
+    if expr.is_number:
+        return float(expr)
+    if expr.is_Symbol:
+        return [S_VARIABLE]
+    if expr.is_Add:
+        op = 'add'
+    elif expr.is_Mul:
+        op = 'mul'
+    elif expr.is_Pow:
+        op = 'pow'
+    else:
+        op = type(expr).__name__.lower()
+    if op not in OPERATIONS or (OPERATIONS[op][0] is not None and OPERATIONS[op][0] != len(expr.args)):
+        raise RuntimeError("Response function '%s' uses %s, which has no NumPy kernel." % (equation,type(expr).__name__))
+    return [op] + [_expression_tree(a,equation) for a in expr.args]
+
+def expression_tree(equation,params):
+    """The expression tree of an equation with the parameters substituted,
+    by way of sympy."""
+    from sympy.parsing import sympy_parser
+
+    expr = sympy_parser.parse_expr(equation,transformations=sympy_parser.standard_transformations + (sympy_parser.convert_xor,),evaluate=False)
+    expr = expr.subs(params)
+    args = sorted(str(s) for s in expr.free_symbols)
+    if len(args) != 1:
+        raise RuntimeError("Response function '%s' has variables %s, expected one." % (equation,args))
+    return _expression_tree(expr,equation)
+
+def check_tree(tree):
+    """Raise ValueError unless tree is a well-formed expression tree."""
+    if isinstance(tree,bool) or not isinstance(tree,(int,float,list)):
+        raise ValueError("Bad expression tree node %r." % (tree,))
+    if isinstance(tree,list):
+        if tree == [S_VARIABLE]:
+            return
+        if len(tree) < 2 or tree[0] not in OPERATIONS:
+            raise ValueError("Bad expression tree node %r." % (tree,))
+        arity = OPERATIONS[tree[0]][0]
+        if arity is not None and len(tree) - 1 != arity:
+            raise ValueError("Bad expression tree node %r." % (tree,))
+        for arg in tree[1:]:
+            check_tree(arg)
+
+def evaluate_tree(tree,x):
+    """The value of a checked expression tree at x."""
+    if not isinstance(tree,list):
+        return float(tree)
+    if tree[0] == S_VARIABLE:
+        return x
+    return OPERATIONS[tree[0]][1]([evaluate_tree(a,x) for a in tree[1:]])
+
+def compile_kernel(equation,params,cache_dir=CACHE_DIR):
+    """A NumPy function of the variable of an equation with the parameters
+    substituted, from the kernel cache when it has been compiled before."""
+    tree = None
+    cache_file = None
+    if cache_dir:
+        cache_file = os.path.join(cache_dir,kernel_key(equation,params) + '.json')
+        try:
+            with open(cache_file,'r') as jsonfile:
+                kernel = json.load(jsonfile)
+            if kernel['version'] == CACHE_VERSION and kernel['equation'] == equation and kernel['parameters'] == params:
+                check_tree(kernel['tree'])
+                tree = kernel['tree']
+        except (OSError,ValueError,KeyError,TypeError,RecursionError):
+            # a missing, stale or malformed entry is compiled again
+            pass
+
+    if tree is None:
+        tree = expression_tree(equation,params)
+        if cache_file is not None:
+            try:
+                os.makedirs(cache_dir,exist_ok=True)
+                tmp_file = "%s.%d.tmp" % (cache_file,os.getpid())
+                with open(tmp_file,'w') as jsonfile:
+                    json.dump({'version': CACHE_VERSION,'equation': equation,'parameters': params,'tree': tree},jsonfile)
+                os.replace(tmp_file,cache_file)
+            except OSError:
+                # the cache is optional
+                pass
+    return lambda x: evaluate_tree(tree,x)
+
+class ResponseFunctions:
+    """The response functions of a list of gates, evaluated together."""
+
+    def __init__(self,collections,cache_dir=CACHE_DIR):
+        self.gate_names = [c['gate_name'] for c in collections]
+        hill = []
+        self._kernels = []
+        for (i,c) in enumerate(collections):
+            params = parameters(c)
+            if is_hill(c['equation'],params):
+                hill.append(i)
+            else:
+                self._kernels.append((i,compile_kernel(c['equation'],params,cache_dir)))
+        self._hill = numpy.array(hill,dtype=numpy.intp)
+        (self.ymin,self.ymax,self.K,self.n) = [numpy.array([parameters(collections[i])[p] for i in hill],dtype=float)[:,None]
+                                               for p in HILL_PARAMETERS]
+
+    def __len__(self):
+        return len(self.gate_names)
+
+    def __call__(self,x):
+        """The output of every gate at each x, as a (gates, len(x)) array;
+        a scalar x is taken as one point, so the result is always 2-D."""
+        x = numpy.atleast_1d(numpy.asarray(x,dtype=float))
+        y = numpy.empty((len(self.gate_names),len(x)))
+        if len(self._hill) > 0:
+            y[self._hill] = self.ymin + (self.ymax - self.ymin) / (1.0 + (x / self.K) ** self.n)
+        for (i,f) in self._kernels:
+            y[i] = f(x)
+        return y
@@ -0,0 +1,93 @@
+import re
+import hashlib
+
+__author__  = 'Timothy S. Jones <jonests@bu.edu>, Densmore Lab, BU'
+__license__ = 'GPL3'
+
+# Content-addressed store for DNA sequences.
+#
+# Every distinct sequence is kept once, under the SHA-256 hex digest of its
+# text, so parts that share a terminator or RBS under different names share
+# one copy, and two sequences are equal exactly when their digests are.
+# With packed=True sequences of A, C, G and T (in either case) are held two
+# bits per base, with the lowercase runs kept separately; anything else is
+# kept as text.
+
+S_UCF_COLLECTION = 'collection'
+S_UCF_DNA_SEQUENCES = 'dna_sequences'
+S_UCF_SEQUENCES = 'sequences'
+
+_BASE_TO_DIGIT = str.maketrans('ACGTacgt','01230123')
+_HEX_TO_BASES = {format(i,'x'): 'ACGT'[i >> 2] + 'ACGT'[i & 3] for i in range(16)}
+_NOT_ACGT = re.compile('[^ACGTacgt]')
+_LOWER = re.compile('[acgt]+')
+
+def digest(sequence):
+    return hashlib.sha256(sequence.encode()).hexdigest()
+
+class PackedSequence:
+    __slots__ = ('length','data','lower')
+
+    def __init__(self,sequence):
+        self.length = len(sequence)
+        # base-4 digits, padded to whole bytes, read as one integer
+        digits = sequence.translate(_BASE_TO_DIGIT)
+        digits = '0' * (-len(digits) % 4) + digits
+        self.data = int(digits,4).to_bytes(len(digits) // 4,'big') if digits else b''
+        self.lower = tuple(m.span() for m in _LOWER.finditer(sequence))
+
+    def __str__(self):
+        hexdigits = self.data.hex()
+        bases = ''.join([_HEX_TO_BASES[h] for h in hexdigits])
+        sequence = bases[len(bases) - self.length:]
+        if self.lower:
+            pieces = []
+            last = 0
+            for (start,end) in self.lower:
+                pieces.append(sequence[last:start])
+                pieces.append(sequence[start:end].lower())
+                last = end
+            pieces.append(sequence[last:])
+            sequence = ''.join(pieces)
+        return sequence
+
+class SequenceStore:
+    def __init__(self,packed=False):
+        self._packed = packed
+        self._sequences = {}
+
+    def add(self,sequence):
+        """Intern a sequence and return its digest."""
+        key = digest(sequence)
+        if key not in self._sequences:
+            if self._packed and not _NOT_ACGT.search(sequence):
+                self._sequences[key] = PackedSequence(sequence)
+            else:
+                self._sequences[key] = sequence
+        return key
+
+    def add_digest(self,key,sequence):
+        """Add a sequence whose digest is already known, e.g. from a UCF."""
+        if key not in self._sequences:
+            if digest(sequence) != key:
+                raise RuntimeError("Sequence does not match digest '%s'." % key)
+            if self._packed and not _NOT_ACGT.search(sequence):
+                self._sequences[key] = PackedSequence(sequence)
+            else:
+                self._sequences[key] = sequence
+
+    def get(self,key):
+        return str(self._sequences[key])
+
+    def __contains__(self,key):
+        return key in self._sequences
+
+    def __len__(self):
+        return len(self._sequences)
+
+    def collection(self,keys=None):
+        """A dna_sequences collection holding the given (default all) digests."""
+        if keys is None:
+            keys = self._sequences.keys()
+        return {S_UCF_COLLECTION: S_UCF_DNA_SEQUENCES,
+                S_UCF_SEQUENCES: {key: self.get(key) for key in keys}}
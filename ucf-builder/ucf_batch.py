@@ -0,0 +1,133 @@
+import os
+import sys
+import copy
+import json
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import ucf_builder
+
+__author__  = 'Timothy S. Jones <jonests@bu.edu>, Densmore Lab, BU'
+__license__ = 'GPL3'
+
+# Build several UCF variants from one manifest.
+#
+# The manifest is a JSON object
+#
+#   {"common": [ARGS],
+#    "variants": [{"name": NAME, "args": [ARGS]}, ...]}
+#
+# where each variant is built as ucf_builder.py with the common arguments
+# followed by its own, and paths are relative to the manifest. Every
+# distinct section of the variants' plans (the same loader over the same
+# input files) is parsed once per run, optionally in --jobs processes, and
+# its collections are shared by every variant that uses it. The variants
+# are then written, in --jobs forked processes where the platform has them,
+# so the parsed collections are shared with the workers instead of copied.
+
+S_COMMON = 'common'
+S_VARIANTS = 'variants'
+S_NAME = 'name'
+S_ARGS = 'args'
+
+def section_id(calls):
+    # the calls of a section, by loader and arguments
+    return json.dumps([(ucf_builder._function_name(f),args) for (f,args,inputs) in calls])
+
+def read_manifest(filename):
+    with open(filename,'r') as jsonfile:
+        manifest = json.load(jsonfile)
+
+    parser = ucf_builder.argument_parser()
+    common = manifest.get(S_COMMON,[])
+    variants = []
+    for (i,variant) in enumerate(manifest.get(S_VARIANTS,[])):
+        name = variant.get(S_NAME,"variant %d" % (i + 1))
+        parser.prog = "%s: %s" % (filename,name)
+        args = parser.parse_args(common + variant.get(S_ARGS,[]))
+        ucf_builder.check_arguments(parser,args)
+        if not args.outfile:
+            parser.error("--outfile required.")
+        variants.append((name,args))
+    if len(variants) == 0:
+        raise RuntimeError("No variants in %s." % filename)
+    return variants
+
+class Batch:
+    def __init__(self,variants,cache_dir=None):
+        self.variants = [(name,args,ucf_builder.build_plan(args)) for (name,args) in variants]
+        self.cache_dir = cache_dir
+        self.sections = {}
+        self._collections = {}
+        for (name,args,(sections,stages,rules,locations)) in self.variants:
+            for calls in sections + stages + [rules,locations]:
+                if len(calls) > 0:
+                    self.sections.setdefault(section_id(calls),calls)
+
+    def parse(self,jobs=1):
+        """Build every distinct section once."""
+        keys = list(self.sections)
+        if jobs > 1:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                futures = [executor.submit(ucf_builder.build_section,self.sections[k],self.cache_dir) for k in keys]
+                for (k,future) in zip(keys,futures):
+                    self._collections[k] = future.result()
+        else:
+            for k in keys:
+                self._collections[k] = ucf_builder.build_section(self.sections[k],self.cache_dir)
+
+    def write(self,i):
+        """Write variant i from the shared collections; returns its problems."""
+        (name,args,plan) = self.variants[i]
+        # the writer empties the lists it is given, and the output options
+        # rewrite the collections themselves
+        if args.dedup_sequences or args.cytometry_sidecar or args.location_store:
+            build = lambda calls: copy.deepcopy(self._collections[section_id(calls)])
+        else:
+            build = lambda calls: list(self._collections[section_id(calls)])
+        return ucf_builder.write_ucf(args,*plan,build=build)
+
+_batch = None
+
+def _write(i):
+    return _batch.write(i)
+
+def main():
+    global _batch
+
+    parser = argparse.ArgumentParser(description="Build the UCF variants of a manifest, parsing each input once.")
+    parser.add_argument("manifest", help="Manifest JSON file.", metavar="FILE")
+    parser.add_argument("--jobs", "-j", type=int, default=1, help="Parse the inputs, and write the variants, in N parallel processes.", metavar="N")
+    parser.add_argument("--cache-dir", dest="cache_dir", help="Cache the collections built from each input here, as ucf_builder --cache-dir.", metavar="DIR")
+    args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1.")
+
+    manifest = os.path.abspath(args.manifest)
+    if args.cache_dir:
+        args.cache_dir = os.path.abspath(args.cache_dir)
+    os.chdir(os.path.dirname(manifest))
+
+    _batch = Batch(read_manifest(manifest),args.cache_dir)
+    _batch.parse(args.jobs)
+
+    indexes = range(len(_batch.variants))
+    if args.jobs > 1 and 'fork' in multiprocessing.get_all_start_methods():
+        with ProcessPoolExecutor(max_workers=args.jobs,mp_context=multiprocessing.get_context('fork')) as executor:
+            results = list(executor.map(_write,indexes))
+    else:
+        results = [_batch.write(i) for i in indexes]
+
+    failed = False
+    for ((name,variant,plan),problems) in zip(_batch.variants,results):
+        for problem in problems:
+            sys.stderr.write("%s: %s\n" % (name,problem))
+        failed = failed or len(problems) > 0
+        sys.stderr.write("%s: wrote %s\n" % (name,variant.outfile))
+    sys.stderr.write("%d variants from %d distinct sections\n" % (len(_batch.variants),len(_batch.sections)))
+    if failed:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,24 @@
 import csv
 import json
 import argparse
+import functools
+import hashlib
+import inspect
+import os
+import sys
 import time
 import warnings
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+from csv_schema import Schema, Column, Group, StringColumns
+from ucf_validate import Validator
+from sequence_store import SequenceStore
+from motif_library import MotifLibrary
+from eugene_rules import RuleGraph, compile_rules
+import genbank
+from location_store import LocationStoreWriter
+import ucf_index
 
 __author__  = 'Timothy S. Jones <jonests@bu.edu>, Densmore Lab, BU'
 __license__ = 'GPL3'
@@ -31,59 +47,31 @@ def add_gates(filename,ucf):
     S_UCF_COLOR_HEXCODE = 'color_hexcode'
 
     reader = csv.reader(open(filename, 'r'), delimiter=',')
-    header = next(reader)
-    
-    header_keys_map = {}
-
-    expected = set([S_CSV_REGULATOR,
-                    S_CSV_GROUP_NAME,
-                    S_CSV_GATE_NAME,
-                    S_CSV_GATE_TYPE,
-                    S_CSV_SYSTEM,
-                    S_CSV_COLOR_HEXCODE])
-    for i,key in enumerate(header):
-        if key in expected:
-            if key == S_CSV_REGULATOR:
-                header_keys_map[S_CSV_REGULATOR] = i
-                expected.remove(S_CSV_REGULATOR)
-            elif key == S_CSV_GROUP_NAME:
-                header_keys_map[S_CSV_GROUP_NAME] = i
-                expected.remove(S_CSV_GROUP_NAME)
-            elif key == S_CSV_GATE_NAME:
-                header_keys_map[S_CSV_GATE_NAME] = i
-                expected.remove(S_CSV_GATE_NAME)
-            elif key == S_CSV_GATE_TYPE:
-                header_keys_map[S_CSV_GATE_TYPE] = i
-                expected.remove(S_CSV_GATE_TYPE)
-            elif key == S_CSV_SYSTEM:
-                header_keys_map[S_CSV_SYSTEM] = i
-                expected.remove(S_CSV_SYSTEM)
-            elif key == S_CSV_COLOR_HEXCODE:
-                header_keys_map[S_CSV_COLOR_HEXCODE] = i
-                expected.remove(S_CSV_COLOR_HEXCODE)
-        else:
-            raise RuntimeError("Unexpected header key in %s at position %d." % (filename,i))
-        
+    columns = StringColumns(next(reader),[S_CSV_REGULATOR,S_CSV_GROUP_NAME,S_CSV_GATE_NAME,
+                                          S_CSV_GATE_TYPE,S_CSV_SYSTEM,S_CSV_COLOR_HEXCODE],filename)
+    (regulator,group_name,gate_name,gate_type,system,color_hexcode) = columns.positions
+
     gates = []
 
     for row in reader:
-        regulator = row[header_keys_map[S_CSV_REGULATOR]]
-        group_name = row[header_keys_map[S_CSV_GROUP_NAME]]
-        gate_name = row[header_keys_map[S_CSV_GATE_NAME]]
-        gate_type = row[header_keys_map[S_CSV_GATE_TYPE]]
-        system = row[header_keys_map[S_CSV_SYSTEM]]
-        color_hexcode = row[header_keys_map[S_CSV_COLOR_HEXCODE]]
-
-        collection = {S_UCF_COLLECTION: S_UCF_GATES,
-                      S_UCF_REGULATOR: regulator,
-                      S_UCF_GROUP_NAME: group_name,
-                      S_UCF_GATE_NAME: gate_name,
-                      S_UCF_GATE_TYPE: gate_type,
-                      S_UCF_SYSTEM: system,
-                      S_UCF_COLOR_HEXCODE: color_hexcode}
+        if not row:
+            continue
+        try:
+            collection = {S_UCF_COLLECTION: S_UCF_GATES,
+                          S_UCF_REGULATOR: row[regulator],
+                          S_UCF_GROUP_NAME: row[group_name],
+                          S_UCF_GATE_NAME: row[gate_name],
+                          S_UCF_GATE_TYPE: row[gate_type],
+                          S_UCF_SYSTEM: row[system],
+                          S_UCF_COLOR_HEXCODE: row[color_hexcode]}
+        except IndexError:
+            columns.reject(reader.line_num,row)
+            continue
 
         gates.append(collection)
 
+    columns.check()
+
     ucf += gates
     return ucf
 
@@ -102,43 +90,32 @@ def add_logic_constraints(filename,ucf):
     S_UCF_TYPE = 'type'
     S_UCF_MAX_INSTANCES = 'max_instances'
     S_UCF_AVAILABLE_GATES = 'available_gates'
-    
-    reader = csv.reader(open(filename, 'r'), delimiter=',')
-    header = next(reader)
-    
-    header_keys_map = {}
 
-    expected = set([S_CSV_TYPE,
-                    S_CSV_MAX_INSTANCES])
-    for i,key in enumerate(header):
-        if key in expected:
-            if key == S_CSV_TYPE:
-                header_keys_map[S_CSV_TYPE] = i
-                expected.remove(S_CSV_TYPE)
-            elif key == S_CSV_MAX_INSTANCES:
-                header_keys_map[S_CSV_MAX_INSTANCES] = i
-                expected.remove(S_CSV_MAX_INSTANCES)
-        else:
-            raise RuntimeError("Unexpected header key in %s at position %d." % (filename,i))
+    # max_instances is kept as a string, it may be e.g. 'true'
+    reader = csv.reader(open(filename, 'r'), delimiter=',')
+    columns = StringColumns(next(reader),[S_CSV_TYPE,S_CSV_MAX_INSTANCES],filename,
+                            required=[S_CSV_TYPE,S_CSV_MAX_INSTANCES])
+    (constraint_type,max_instances) = columns.positions
 
     collection = {S_UCF_COLLECTION: S_UCF_LOGIC_CONTRAINTS,
                   S_UCF_AVAILABLE_GATES: []}
 
     for row in reader:
-        if len(row) > 0:
-            constraint_type = row[header_keys_map[S_CSV_TYPE]]
-            if len(constraint_type) == 0:
-                raise RuntimeError("'%s' not specified." % S_CSV_TYPE)
+        if not row:
+            continue
+        try:
+            constraint = {S_UCF_TYPE: row[constraint_type],
+                          S_UCF_MAX_INSTANCES: row[max_instances]}
+        except IndexError:
+            constraint = None
+        if constraint is None or not constraint[S_UCF_TYPE] or not constraint[S_UCF_MAX_INSTANCES]:
+            columns.reject(reader.line_num,row)
+            continue
 
-            max_instances = row[header_keys_map[S_CSV_MAX_INSTANCES]]
-            if len(max_instances) == 0:
-                raise RuntimeError("'%s' not specified." % S_CSV_MAX_INSTANCES)
+        collection[S_UCF_AVAILABLE_GATES].append(constraint)
 
-            constraint = {S_UCF_TYPE: constraint_type,
-                          S_UCF_MAX_INSTANCES: max_instances}
+    columns.check()
 
-            collection[S_UCF_AVAILABLE_GATES].append(constraint)
-                    
     ucf.append(collection)
     return ucf
 
@@ -278,123 +255,46 @@ def add_response_functions(filename,ucf):
     S_UCF_ON_THRESHOLD = "on_threshold"
     S_UCF_PARAMETER_NAME = "name"
     S_UCF_PARAMETER_VALUE = "value"
-    
-    reader = csv.reader(open(filename, 'r'), delimiter=',')
-    header = next(reader)
-    
-    header_keys_map = {S_UCF_VARIABLES:[],S_UCF_PARAMETERS:[]}
 
-    expected = set([S_CSV_GATE_NAME,
-                    S_CSV_EQUATION,
-                    S_CSV_VARIABLE_NAME,
-                    S_CSV_PARAMETER_NAME])
-    for i,key in enumerate(header):
-        if key in expected:
-            if key == S_CSV_GATE_NAME:
-                header_keys_map[S_UCF_GATE_NAME] = i
-                expected.remove(S_CSV_GATE_NAME)
-                for s in [S_CSV_PARAMETER_VALUE,S_CSV_OFF_THRESHOLD,S_CSV_ON_THRESHOLD]:
-                    if s in expected:
-                        expected.remove(s)
-            elif key == S_CSV_EQUATION:
-                header_keys_map[S_UCF_EQUATION] = i
-                expected.remove(S_CSV_EQUATION)
-                for s in [S_CSV_PARAMETER_VALUE,S_CSV_OFF_THRESHOLD,S_CSV_ON_THRESHOLD]:
-                    if s in expected:
-                        expected.remove(s)
-            elif key == S_CSV_VARIABLE_NAME:
-                header_keys_map[S_UCF_VARIABLES].append({S_UCF_VARIABLE_NAME:i})
-                expected.add(S_CSV_OFF_THRESHOLD)
-                expected.add(S_CSV_ON_THRESHOLD)
-                if S_CSV_PARAMETER_VALUE in expected:
-                    expected.remove(S_CSV_PARAMETER_VALUE)
-            elif key == S_CSV_OFF_THRESHOLD:
-                variable = header_keys_map[S_UCF_VARIABLES][-1]
-                variable[S_UCF_OFF_THRESHOLD] = i
-                expected.remove(S_CSV_OFF_THRESHOLD)
-            elif key == S_CSV_ON_THRESHOLD:
-                variable = header_keys_map[S_UCF_VARIABLES][-1]
-                variable[S_UCF_ON_THRESHOLD] = i
-                expected.remove(S_CSV_ON_THRESHOLD)
-            elif key == S_CSV_PARAMETER_NAME:
-                header_keys_map[S_UCF_PARAMETERS].append({S_UCF_PARAMETER_NAME:i})
-                expected.add(S_CSV_PARAMETER_VALUE)
-            elif key == S_CSV_PARAMETER_VALUE:
-                parameter = header_keys_map[S_UCF_PARAMETERS][-1]
-                parameter[S_UCF_PARAMETER_VALUE] = i
-                expected.remove(S_CSV_PARAMETER_VALUE)
-                
-        else:
-            raise RuntimeError("Unexpected header key in %s at position %d." % (filename,i))
+    # every variable_name is followed by its thresholds and every
+    # parameter_name by its value
+    schema = Schema([Column(S_CSV_GATE_NAME),
+                     Column(S_CSV_EQUATION,required=False)],
+                    [Group(Column(S_CSV_VARIABLE_NAME),
+                           [Column(S_CSV_OFF_THRESHOLD,float),
+                            Column(S_CSV_ON_THRESHOLD,float)]),
+                     Group(Column(S_CSV_PARAMETER_NAME),
+                           [Column(S_CSV_PARAMETER_VALUE,float)])])
+
+    reader = csv.reader(open(filename, 'r'), delimiter=',')
+    decoder = schema.compile(next(reader),filename)
 
     response_functions = []
+    names = set()
 
-    for row in reader:
-        if len(row) > 0:
-            collection = {}
+    for (name,equation,variable_values,parameter_values) in decoder.rows(reader):
+        if name in names:
+            raise RuntimeError("Response function already specified for '%s'." % name)
+        names.add(name)
 
-            #############################
-            # find or create collection #
-            #############################
-            name = row[header_keys_map[S_UCF_GATE_NAME]]
-            if len(name) == 0:
-                raise RuntimeError("Gate name not specified.")
-            else:
-                for c in response_functions:
-                    if c[S_UCF_GATE_NAME] == name:
-                        raise RuntimeError("Response function already specified for '%s'." % name)
+        variables = [{S_UCF_VARIABLE_NAME:variable,
+                      S_UCF_OFF_THRESHOLD:off_threshold,
+                      S_UCF_ON_THRESHOLD:on_threshold}
+                     for (variable,off_threshold,on_threshold) in variable_values]
 
-                collection[S_UCF_COLLECTION] = S_UCF_RESPONSE_FUNCTIONS
-                collection[S_UCF_GATE_NAME] = name
-                response_functions.append(collection)
+        parameters = [{S_UCF_PARAMETER_NAME:parameter,
+                       S_UCF_PARAMETER_VALUE:value}
+                      for (parameter,value) in parameter_values]
 
-            ############
-            # equation #
-            ############
-            collection[S_UCF_EQUATION] = row[header_keys_map[S_UCF_EQUATION]]
-
-            #############
-            # variables #
-            #############
-            variable_specs = header_keys_map[S_UCF_VARIABLES]
-            variables = []
-            for spec in variable_specs:
-                variable = row[spec[S_UCF_VARIABLE_NAME]]
-                
-                if len(variable) == 0:
-                    continue
-
-                off_threshold = row[spec[S_UCF_OFF_THRESHOLD]]
-                on_threshold = row[spec[S_UCF_ON_THRESHOLD]]
-                if len(off_threshold) == 0:
-                    raise RuntimeError("No %s specified for variable '%s'." % (S_CSV_OFF_THRESHOLD,variable))
-                if len(on_threshold) == 0:
-                    raise RuntimeError("No %s specified for variable '%s'." % (S_CSV_ON_THRESHOLD,variable))
-                variables.append({S_UCF_VARIABLE_NAME:variable,
-                                  S_UCF_OFF_THRESHOLD:float(off_threshold),
-                                  S_UCF_ON_THRESHOLD:float(on_threshold)})
-
-            collection[S_UCF_VARIABLES] = variables
-
-            ##############
-            # parameters #
-            ##############
-            parameter_specs = header_keys_map[S_UCF_PARAMETERS]
-            parameters = []
-            for spec in parameter_specs:
-                parameter = row[spec[S_UCF_PARAMETER_NAME]]
-                
-                if len(parameter) == 0:
-                    continue
+        collection = {S_UCF_COLLECTION: S_UCF_RESPONSE_FUNCTIONS,
+                      S_UCF_GATE_NAME: name,
+                      S_UCF_EQUATION: equation,
+                      S_UCF_VARIABLES: variables,
+                      S_UCF_PARAMETERS: parameters}
+        response_functions.append(collection)
 
-                value = row[spec[S_UCF_PARAMETER_VALUE]]
-                if len(value) == 0:
-                    raise RuntimeError("No %s specified for parameter '%s'." % (S_CSV_PARAMETER_VALUE,parameter))
-                parameters.append({S_UCF_PARAMETER_NAME:parameter,
-                                  S_UCF_PARAMETER_VALUE:float(value)})
+    decoder.check()
 
-            collection[S_UCF_PARAMETERS] = parameters
-            
     ucf += response_functions
     return ucf
 
@@ -414,74 +314,58 @@ def add_parts(filename,ucf):
     S_UCF_PART_NAME = "name"
     S_UCF_PART_TYPE = "type"
     S_UCF_PART_DNASEQUENCE = "dnasequence"
-    
-    reader = csv.reader(open(filename, 'r'), delimiter=',')
-    header = next(reader)
-    
-    header_keys_map = {}
-
-    expected = set([S_CSV_PART_NAME,
-                    S_CSV_PART_TYPE,
-                    S_CSV_PART_DNASEQUENCE])
-    for i,key in enumerate(header):
-        if key in expected:
-            if key == S_CSV_PART_NAME:
-                header_keys_map[S_UCF_PART_NAME] = i
-                expected.remove(S_CSV_PART_NAME)
-            elif key == S_CSV_PART_TYPE:
-                header_keys_map[S_UCF_PART_TYPE] = i
-                expected.remove(S_CSV_PART_TYPE)
-            elif key == S_CSV_PART_DNASEQUENCE:
-                header_keys_map[S_UCF_PART_DNASEQUENCE] = i
-                expected.remove(S_CSV_PART_DNASEQUENCE)
-        else:
-            raise RuntimeError("Unexpected header key in %s at position %d." % (filename,i))
 
-    parts = []
+    # type and dnasequence are checked after the duplicate names, which are
+    # skipped whatever they hold
+    schema = Schema([Column(S_CSV_PART_NAME),
+                     Column(S_CSV_PART_TYPE,required=False),
+                     Column(S_CSV_PART_DNASEQUENCE,required=False)])
 
-    for row in reader:
-        if len(row) > 0:
-            collection = {}
-
-            part_name = row[header_keys_map[S_CSV_PART_NAME]]
-            if len(part_name) == 0:
-                raise RuntimeError("Part name not specified.")
-            else:
-                for c in parts:
-                    if c[S_UCF_PART_NAME] == part_name:
-                        collection = c
-
-                if len(collection) == 0:
-                    collection[S_UCF_COLLECTION] = S_UCF_PARTS
-                    collection[S_UCF_PART_NAME] = part_name
-                    parts.append(collection)
-                else:
-                    warnings.warn("Part '%s' already specified, skipping." % part_name,RuntimeWarning)
-                    continue
-
-            part_type = row[header_keys_map[S_CSV_PART_TYPE]]
-            if len(part_type) == 0:
-                raise RuntimeError("Part type not specified for '%s'." % part_name)
-            collection[S_UCF_PART_TYPE] = part_type
+    reader = csv.reader(open(filename, 'r'), delimiter=',')
+    decoder = schema.compile(next(reader),filename)
 
-            part_dnasequence = row[header_keys_map[S_CSV_PART_DNASEQUENCE]]
-            if len(part_dnasequence) == 0:
-                raise RuntimeError("Part dna sequence not specified for '%s'." % part_name)
-            collection[S_UCF_PART_DNASEQUENCE] = part_dnasequence
+    parts = []
+    names = set()
+    # parts with the same sequence share one string
+    sequences = {}
+
+    for (part_name,part_type,part_dnasequence) in decoder.rows(reader):
+        if part_name in names:
+            warnings.warn("Part '%s' already specified, skipping." % part_name,RuntimeWarning)
+            continue
+        names.add(part_name)
+        if not part_type or not part_dnasequence:
+            missing = S_CSV_PART_TYPE if not part_type else S_CSV_PART_DNASEQUENCE
+            decoder.reject(reader.line_num,"'%s' not specified for '%s'." % (missing,part_name))
+            continue
+        part_dnasequence = sequences.setdefault(part_dnasequence,part_dnasequence)
+
+        collection = {S_UCF_COLLECTION: S_UCF_PARTS,
+                      S_UCF_PART_NAME: part_name,
+                      S_UCF_PART_TYPE: part_type,
+                      S_UCF_PART_DNASEQUENCE: part_dnasequence}
+        parts.append(collection)
+
+    decoder.check()
 
     ucf += parts
     return ucf
 
 def add_motif_library(filename,ucf):
-    raise NotImplementedError("Motif library not implemented.")
-
-def add_standard_motif_library(ucf):
-    with open('std-motif.json', 'r') as jsonfile:
-        motif = json.load(jsonfile)
+    library = MotifLibrary.load(filename)
+    if library.duplicates > 0:
+        warnings.warn("%d structurally duplicate motifs in %s skipped." % (library.duplicates,filename),RuntimeWarning)
+    if len(library.others) > 0:
+        warnings.warn("%d records of %s are not motifs, copied as they are." % (len(library.others),filename),RuntimeWarning)
 
-    ucf += motif
+    ucf += library.collections()
     return ucf
 
+STD_MOTIF_LIBRARY = os.path.join(os.path.dirname(os.path.abspath(__file__)),'std-motif.json')
+
+def add_standard_motif_library(ucf):
+    return add_motif_library(STD_MOTIF_LIBRARY,ucf)
+
 def add_toxicity(filename,ucf):
     ###############
     # header keys #
@@ -500,69 +384,35 @@ def add_toxicity(filename,ucf):
     S_UCF_VARIABLE_NAME = "maps_to_variable"
     S_UCF_INPUT = "input"
     S_UCF_GROWTH = "growth"
-    
+
+    schema = Schema([Column(S_CSV_GATE_NAME),
+                     Column(S_CSV_VARIABLE_NAME),
+                     Column(S_CSV_INPUT,float),
+                     Column(S_CSV_GROWTH,float)])
+
     reader = csv.reader(open(filename, 'r'), delimiter=',')
-    header = next(reader)
-    
-    header_keys_map = {}
+    decoder = schema.compile(next(reader),filename)
 
-    expected = set([S_CSV_GATE_NAME,
-                    S_CSV_VARIABLE_NAME,
-                    S_CSV_INPUT,
-                    S_CSV_GROWTH])
-    for i,key in enumerate(header):
-        if key in expected:
-            if key == S_CSV_GATE_NAME:
-                header_keys_map[S_UCF_GATE_NAME] = i
-                expected.remove(S_CSV_GATE_NAME)
-            elif key == S_CSV_VARIABLE_NAME:
-                header_keys_map[S_UCF_VARIABLE_NAME] = i
-                expected.remove(S_CSV_VARIABLE_NAME)
-            elif key == S_CSV_INPUT:
-                header_keys_map[S_UCF_INPUT] = i
-                expected.remove(S_CSV_INPUT)
-            elif key == S_CSV_GROWTH:
-                header_keys_map[S_UCF_GROWTH] = i
-                expected.remove(S_CSV_GROWTH)
-        else:
-            raise RuntimeError("Unexpected header key in %s at position %d." % (filename,i))
+    # collections keyed by (gate name, variable), in order of first
+    # appearance
+    toxicity = {}
 
-    toxicity = []
+    for (gate_name,variable,input_value,growth_value) in decoder.rows(reader):
+        collection = toxicity.get((gate_name,variable))
+        if collection is None:
+            collection = {S_UCF_COLLECTION: S_UCF_TOXICITY,
+                          S_UCF_GATE_NAME: gate_name,
+                          S_UCF_VARIABLE_NAME: variable,
+                          S_UCF_INPUT: [],
+                          S_UCF_GROWTH: []}
+            toxicity[(gate_name,variable)] = collection
 
-    for row in reader:
-        if len(row) > 0:
-            collection = {}
+        collection[S_UCF_INPUT].append(input_value)
+        collection[S_UCF_GROWTH].append(growth_value)
 
-            gate_name = row[header_keys_map[S_UCF_GATE_NAME]]
-            variable = row[header_keys_map[S_UCF_VARIABLE_NAME]]
-            if len(gate_name) == 0:
-                raise RuntimeError("Gate name not specified.")
-            elif len(variable) == 0:
-                raise RuntimeError("Variable name not specified.")
-            else:
-                for c in toxicity:
-                    if c[S_UCF_GATE_NAME] == gate_name and c[S_UCF_VARIABLE_NAME] == variable:
-                        collection = c
+    decoder.check()
 
-                if len(collection) == 0:
-                    collection[S_UCF_COLLECTION] = S_UCF_TOXICITY
-                    collection[S_UCF_GATE_NAME] = gate_name
-                    collection[S_UCF_VARIABLE_NAME] = variable
-                    collection[S_UCF_INPUT] = []
-                    collection[S_UCF_GROWTH] = []
-                    toxicity.append(collection)
-
-            input_value = row[header_keys_map[S_CSV_INPUT]]
-            if len(input_value) == 0:
-                raise RuntimeError("Input value not specified for '%s'." % input_value)
-            collection[S_UCF_INPUT].append(float(input_value))
-
-            growth_value = row[header_keys_map[S_CSV_GROWTH]]
-            if len(growth_value) == 0:
-                raise RuntimeError("Growth value not specified for '%s'." % gate_name)
-            collection[S_UCF_GROWTH].append(float(growth_value))
-
-    ucf += toxicity
+    ucf += toxicity.values()
     return ucf
 
 def add_cytometry(filename,ucf):
@@ -586,90 +436,48 @@ def add_cytometry(filename,ucf):
     S_UCF_OUTPUT_BIN = 'output_bins'
     S_UCF_OUTPUT_COUNT = 'output_counts'
     S_UCF_CYTOMETRY_DATA = 'cytometry_data'
-    
-    reader = csv.reader(open(filename, 'r'), delimiter=',')
-    header = next(reader)
-    
-    header_keys_map = {}
 
-    expected = set([S_CSV_GATE_NAME,
-                    S_CSV_VARIABLE,
-                    S_CSV_INPUT,
-                    S_CSV_OUTPUT_BIN,
-                    S_CSV_OUTPUT_COUNT])
-    for i,key in enumerate(header):
-        if key in expected:
-            if key == S_CSV_GATE_NAME:
-                header_keys_map[S_CSV_GATE_NAME] = i
-                expected.remove(S_CSV_GATE_NAME)
-            elif key == S_CSV_VARIABLE:
-                header_keys_map[S_CSV_VARIABLE] = i
-                expected.remove(S_CSV_VARIABLE)
-            elif key == S_CSV_INPUT:
-                header_keys_map[S_CSV_INPUT] = i
-                expected.remove(S_CSV_INPUT)
-            elif key == S_CSV_OUTPUT_BIN:
-                header_keys_map[S_CSV_OUTPUT_BIN] = i
-                expected.remove(S_CSV_OUTPUT_BIN)
-            elif key == S_CSV_OUTPUT_COUNT:
-                header_keys_map[S_CSV_OUTPUT_COUNT] = i
-                expected.remove(S_CSV_OUTPUT_COUNT)
-        else:
-            raise RuntimeError("Unexpected header key in %s at position %d." % (filename,i))
-
-    cytometry = []
-
-    for row in reader:
-        if len(row) > 0:
-            collection = {}
-
-            gate_name = row[header_keys_map[S_CSV_GATE_NAME]]
-            if len(gate_name) == 0:
-                raise RuntimeError("Gate name not specified.")
-            else:
-                for c in cytometry:
-                    if c[S_UCF_GATE_NAME] == gate_name:
-                        collection = c
-
-                if len(collection) == 0:
-                    collection[S_UCF_COLLECTION] = S_UCF_CYTOMETRY
-                    collection[S_UCF_GATE_NAME] = gate_name
-                    collection[S_UCF_CYTOMETRY_DATA] = []
-                    cytometry.append(collection)
+    schema = Schema([Column(S_CSV_GATE_NAME),
+                     Column(S_CSV_VARIABLE),
+                     Column(S_CSV_INPUT,float),
+                     Column(S_CSV_OUTPUT_BIN,float),
+                     Column(S_CSV_OUTPUT_COUNT,float)])
 
-                variable = row[header_keys_map[S_CSV_VARIABLE]]
-                if len(variable) == 0:
-                    raise RuntimeError("'%s' name not specified." % S_CSV_VARIABLE )
-
-                cytometry_input = row[header_keys_map[S_CSV_INPUT]]
-                if len(cytometry_input) == 0:
-                    raise RuntimeError("'%s' name not specified." % S_CSV_INPUT)
-
-                output_bin = row[header_keys_map[S_CSV_OUTPUT_BIN]]
-                if len(output_bin) == 0:
-                    raise RuntimeError("'%s' name not specified." % S_CSV_OUTPUT_BIN)
-
-                output_count = row[header_keys_map[S_CSV_OUTPUT_COUNT]]
-                if len(output_count) == 0:
-                    raise RuntimeError("'%s' name not specified." % S_CSV_OUTPUT_COUNT)
-
-                data = {}
-                for obj in collection[S_UCF_CYTOMETRY_DATA]:
-                    if obj[S_UCF_VARIABLE] == variable and obj[S_UCF_INPUT] == float(cytometry_input):
-                        data = obj
-                        break
-
-                if len(data) == 0:
-                    collection[S_UCF_CYTOMETRY_DATA].append(data)
-                    data[S_UCF_VARIABLE] = variable
-                    data[S_UCF_INPUT] = float(cytometry_input)
-                    data[S_UCF_OUTPUT_BIN] = []
-                    data[S_UCF_OUTPUT_COUNT] = []
-                    
-                data[S_UCF_OUTPUT_BIN].append(float(output_bin))
-                data[S_UCF_OUTPUT_COUNT].append(float(output_count))
-                    
-    ucf += cytometry
+    reader = csv.reader(open(filename, 'r'), delimiter=',')
+    decoder = schema.compile(next(reader),filename)
+
+    # collections keyed by gate name, and the bins/counts lists of each
+    # cytometry_data entry keyed by (gate name, variable, input); dicts
+    # keep insertion order, so the output order is the order of first
+    # appearance in the file
+    cytometry = {}
+    data_index = {}
+
+    for (gate_name,variable,cytometry_input,output_bin,output_count) in decoder.rows(reader):
+        key = (gate_name,variable,cytometry_input)
+        lists = data_index.get(key)
+        if lists is None:
+            collection = cytometry.get(gate_name)
+            if collection is None:
+                collection = {S_UCF_COLLECTION: S_UCF_CYTOMETRY,
+                              S_UCF_GATE_NAME: gate_name,
+                              S_UCF_CYTOMETRY_DATA: []}
+                cytometry[gate_name] = collection
+
+            data = {S_UCF_VARIABLE: variable,
+                    S_UCF_INPUT: cytometry_input,
+                    S_UCF_OUTPUT_BIN: [],
+                    S_UCF_OUTPUT_COUNT: []}
+            collection[S_UCF_CYTOMETRY_DATA].append(data)
+            lists = (data[S_UCF_OUTPUT_BIN],data[S_UCF_OUTPUT_COUNT])
+            data_index[key] = lists
+
+        lists[0].append(output_bin)
+        lists[1].append(output_count)
+
+    decoder.check()
+
+    ucf += cytometry.values()
     return ucf
 
 def add_header(filename,ucf):
@@ -801,6 +609,8 @@ def add_measurement_plasmid(filename,ucf):
     plasmid_sequence = []
     with open(filename, 'r') as plasmidfile:
         plasmid_sequence = plasmidfile.read().splitlines()
+    # fails on a malformed file, rather than when the UCF is used
+    genbank.parse(plasmid_sequence,filename,sequence=False)
 
     collection[S_UCF_SEQUENCE] = plasmid_sequence
 
@@ -826,9 +636,8 @@ def add_part_placement_rules(filename,ucf):
         collection = {S_UCF_COLLECTION: S_UCF_PLACEMENT_RULES}
         ucf.append(collection)
 
-    rules = []
-    with open(filename, 'r') as rulesfile:
-        rules = rulesfile.read().splitlines()
+    # raises on a cycle, warns of STARTSWITH conflicts
+    rules = compile_rules(filename).rules
 
     collection[S_UCF_PART_PLACEMENT_RULES] = rules
 
@@ -854,14 +663,30 @@ def add_gate_placement_rules(filename,ucf):
         collection = {S_UCF_COLLECTION: S_UCF_PLACEMENT_RULES}
         ucf.append(collection)
 
-    rules = []
-    with open(filename, 'r') as rulesfile:
-        rules = rulesfile.read().splitlines()
+    # raises on a cycle, warns of STARTSWITH conflicts
+    rules = compile_rules(filename).rules
 
     collection[S_UCF_GATE_PLACEMENT_RULES] = rules
 
     return ucf
 
+def reduce_placement_rules(ucf):
+    ############
+    # ucf keys #
+    ############
+    S_UCF_COLLECTION = 'collection'
+    S_UCF_PLACEMENT_RULES = 'eugene_rules'
+    S_UCF_PART_PLACEMENT_RULES = 'eugene_part_rules'
+    S_UCF_GATE_PLACEMENT_RULES = 'eugene_gate_rules'
+
+    for c in ucf:
+        if c[S_UCF_COLLECTION] == S_UCF_PLACEMENT_RULES:
+            for key in (S_UCF_PART_PLACEMENT_RULES,S_UCF_GATE_PLACEMENT_RULES):
+                if key in c:
+                    c[key] = RuleGraph(c[key],key).reduced()
+
+    return ucf
+
 def add_genetic_locations_files(filename,name,ucf):
     ############
     # ucf keys #
@@ -886,8 +711,11 @@ def add_genetic_locations_files(filename,name,ucf):
 
     locations = collection[S_UCF_LOCATIONS]
     with open(filename, 'r') as locfile:
-        locations.append({S_UCF_FILE: locfile.read().splitlines(),
-                          S_UCF_NAME: name})
+        lines = locfile.read().splitlines()
+    # fails on a malformed file, rather than when the UCF is used
+    genbank.parse(lines,filename,sequence=False)
+    locations.append({S_UCF_FILE: lines,
+                      S_UCF_NAME: name})
 
     return ucf
 
@@ -963,10 +791,284 @@ def add_genetic_locations(filename,ucf):
             else:
                 warnings.warn("Unrecognized key '%s'" % key,RuntimeWarning)
 
+    check_genetic_locations(collection,filename)
+
     ucf.append(collection)
     return ucf
 
-def main():
+def check_genetic_locations(collection,filename):
+    """Check the module coordinates against the location files given."""
+    ############
+    # ucf keys #
+    ############
+    S_UCF_LOCATIONS = 'locations'
+    S_UCF_FILE = 'file'
+    S_UCF_NAME = 'name'
+    S_UCF_LOCATION_NAME = 'location_name'
+    S_UCF_MODULE_LOCS = ['sensor_module_location','circuit_module_location','output_module_location']
+    S_UCF_BP_START = 'bp_start'
+    S_UCF_BP_END = 'bp_end'
+
+    files = {l[S_UCF_NAME]: l[S_UCF_FILE] for l in collection.get(S_UCF_LOCATIONS,[])}
+    records = {}
+    for key in S_UCF_MODULE_LOCS:
+        for loc in collection.get(key,[]):
+            name = loc.get(S_UCF_LOCATION_NAME)
+            if name not in files or S_UCF_BP_START not in loc or S_UCF_BP_END not in loc:
+                continue
+            if name not in records:
+                records[name] = genbank.parse(files[name],name,sequence=False)
+            record = records[name]
+            start = loc[S_UCF_BP_START]
+            end = loc[S_UCF_BP_END]
+            if not (1 <= start <= record.length and 1 <= end <= record.length):
+                raise RuntimeError("%s: %s %d..%d outside the %d bp of '%s'."
+                                   % (filename,key,start,end,record.length,name))
+            if start > end and not record.circular:
+                raise RuntimeError("%s: %s %d..%d ends before it starts in linear '%s'."
+                                   % (filename,key,start,end,name))
+            if start <= end:
+                for f in record.split(start,end):
+                    warnings.warn("%s: %s %d..%d cuts through %s %s (%s) of '%s'."
+                                  % (filename,key,start,end,f.key,f.location,f.label,name),RuntimeWarning)
+
+class UCFWriter:
+    """Write the top-level UCF array one collection at a time.
+
+    The output is identical to json.dumps(ucf,indent=2) of the whole list
+    (or to the separators=(',',':') encoding when compact), but only the
+    collections passed to a single write() are held in memory.
+    """
+
+    def __init__(self,outfile,compact=False):
+        self._outfile = outfile
+        self._compact = compact
+        self._count = 0
+        if compact:
+            self._encoder = json.JSONEncoder(separators=(',',':'))
+        else:
+            self._encoder = json.JSONEncoder(indent=2)
+
+    def _separator(self):
+        if self._compact:
+            self._outfile.write(',' if self._count > 0 else '[')
+        else:
+            self._outfile.write(',\n  ' if self._count > 0 else '[\n  ')
+        self._count += 1
+
+    def write(self,ucf):
+        """Write the finished collections in ucf and empty the list."""
+        for collection in ucf:
+            self._separator()
+            if self._compact:
+                for chunk in self._encoder.iterencode(collection):
+                    self._outfile.write(chunk)
+            else:
+                for chunk in self._encoder.iterencode(collection):
+                    self._outfile.write(chunk.replace('\n','\n  '))
+        del ucf[:]
+
+    def write_encoded(self,data):
+        """Write one collection already encoded as JSON text, as it is."""
+        self._separator()
+        self._outfile.write(data)
+
+    def close(self):
+        if self._count == 0:
+            self._outfile.write('[]')
+        elif self._compact:
+            self._outfile.write(']')
+        else:
+            self._outfile.write('\n]')
+        self._outfile.write('\n')
+        self._outfile.flush()
+
+class CytometrySidecar:
+    """Move the gate_cytometry bins and counts to a binary sidecar file.
+
+    The values are written as raw little-endian float64, and each list in
+    the UCF is replaced by a reference {"sidecar": name, "offset": bytes,
+    "length": count} that ucf_model.UCF resolves with a memory map.
+    """
+
+    def __init__(self,filename,name):
+        self._file = open(filename,'wb')
+        self._name = name
+        self._offset = 0
+
+    def _write(self,values):
+        values = array('d',values)
+        if sys.byteorder != 'little':
+            values.byteswap()
+        values.tofile(self._file)
+        reference = {'sidecar': self._name,
+                     'offset': self._offset,
+                     'length': len(values)}
+        self._offset += values.itemsize * len(values)
+        return reference
+
+    def write(self,ucf):
+        for c in ucf:
+            if c['collection'] == 'gate_cytometry':
+                for data in c['cytometry_data']:
+                    data['output_bins'] = self._write(data['output_bins'])
+                    data['output_counts'] = self._write(data['output_counts'])
+        return ucf
+
+    def close(self):
+        self._file.close()
+
+class LocationSequences:
+    """Move the ORIGIN sequences of the genetic location files to a
+    location_store file.
+
+    The file lines of each location keep everything but the sequence, and
+    the location gets a reference {"store": name, "location": NAME,
+    "length": BP} that location_store.LocationStore reads by bp range.
+    """
+
+    def __init__(self,filename,name):
+        self._writer = LocationStoreWriter(filename,name)
+
+    def write(self,ucf):
+        for c in ucf:
+            if c['collection'] == 'genetic_locations':
+                for location in c.get('locations',[]):
+                    # the collection may be listed more than once
+                    if 'sequence' in location:
+                        continue
+                    lines = location['file']
+                    record = genbank.parse(lines,location['name'])
+                    kept = []
+                    in_origin = False
+                    for line in lines:
+                        if line.startswith(genbank.S_ORIGIN):
+                            in_origin = True
+                        elif line.startswith(genbank.S_END):
+                            in_origin = False
+                        if not in_origin:
+                            kept.append(line)
+                    location['file'] = kept
+                    location['sequence'] = self._writer.add(location['name'],record.sequence or '',record.circular)
+        return ucf
+
+    def close(self):
+        self._writer.close()
+
+def dedup_sequences(store,ucf):
+    ############
+    # ucf keys #
+    ############
+    S_UCF_COLLECTION = 'collection'
+    S_UCF_PARTS = 'parts'
+    S_UCF_PART_DNASEQUENCE = 'dnasequence'
+    S_UCF_PART_DNASEQUENCE_DIGEST = 'dnasequence_sha256'
+
+    # replace each part's sequence with its digest, and follow the parts
+    # with a dna_sequences collection holding the sequences not yet written
+    new = []
+    for c in ucf:
+        if c[S_UCF_COLLECTION] == S_UCF_PARTS and S_UCF_PART_DNASEQUENCE in c:
+            sequence = c.pop(S_UCF_PART_DNASEQUENCE)
+            known = len(store)
+            digest = store.add(sequence)
+            if len(store) > known:
+                new.append(digest)
+            c[S_UCF_PART_DNASEQUENCE_DIGEST] = digest
+    if len(new) > 0:
+        ucf.append(store.collection(new))
+    return ucf
+
+def add_columnar(loader,filename,ucf):
+    stats = {}
+    start = time.perf_counter()
+    ucf = loader(filename,ucf,stats)
+    elapsed = time.perf_counter() - start
+    sys.stderr.write("%s: %d rows in %.3f s (%.0f rows/sec)\n"
+                     % (filename,stats['rows'],elapsed,stats['rows'] / elapsed if elapsed > 0 else 0.0))
+    return ucf
+
+def _function_name(f):
+    if isinstance(f,functools.partial):
+        return "%s(%s)" % (_function_name(f.func),",".join(_function_name(a) for a in f.args))
+    return f.__qualname__
+
+BUILDER_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def _module_sources(module,sources):
+    # add the source of a builder module, and of every builder module it
+    # imports or imports names from, to sources by module name
+    filename = getattr(module,'__file__',None)
+    if filename is None or module.__name__ in sources or os.path.dirname(os.path.abspath(filename)) != BUILDER_DIR:
+        return
+    sources[module.__name__] = os.path.abspath(filename)
+    for value in list(vars(module).values()):
+        if inspect.ismodule(value):
+            _module_sources(value,sources)
+        elif inspect.isfunction(value) or inspect.isclass(value):
+            owner = sys.modules.get(value.__module__)
+            if owner is not None:
+                _module_sources(owner,sources)
+
+def _function_sources(f):
+    if isinstance(f,functools.partial):
+        sources = _function_sources(f.func)
+        for a in f.args:
+            sources += _function_sources(a)
+        return sources
+    modules = {}
+    _module_sources(sys.modules[f.__module__],modules)
+    return sorted(set(modules.values()))
+
+def _file_digest(filename):
+    digest = hashlib.sha256()
+    with open(filename,'rb') as f:
+        for block in iter(lambda: f.read(1 << 20),b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def section_key(calls):
+    # the digest of every input file and of the source of every loader,
+    # with the builder modules it uses (csv_schema, genbank, ...), so that
+    # editing any of them invalidates the cached fragment
+    digest = hashlib.sha256()
+    for (f,args,inputs) in calls:
+        digest.update(_function_name(f).encode())
+        for source in _function_sources(f):
+            digest.update(_file_digest(source).encode())
+        digest.update(json.dumps(args).encode())
+        for filename in inputs:
+            digest.update(_file_digest(filename).encode())
+    return digest.hexdigest()
+
+def build_section(calls,cache_dir=None):
+    """Run a list of (function,args,inputs) stages starting from an empty
+    UCF and return the collections they produce.
+
+    With a cache_dir, the collections are stored as a JSON fragment keyed by
+    the content of the inputs files, and later builds with unchanged inputs
+    load the fragment instead of running the stages.
+    """
+    if cache_dir is not None:
+        cache_file = os.path.join(cache_dir,section_key(calls) + '.json')
+        if os.path.exists(cache_file):
+            with open(cache_file,'r') as jsonfile:
+                return json.load(jsonfile)
+
+    ucf = []
+    for (f,args,inputs) in calls:
+        ucf = f(*(tuple(args) + (ucf,)))
+
+    if cache_dir is not None:
+        os.makedirs(cache_dir,exist_ok=True)
+        tmp_file = "%s.%d.tmp" % (cache_file,os.getpid())
+        with open(tmp_file,'w') as jsonfile:
+            json.dump(ucf,jsonfile)
+        os.replace(tmp_file,cache_file)
+
+    return ucf
+
+def argument_parser():
     parser = argparse.ArgumentParser(description="Build a UCF.")
     parser.add_argument("--header", "-e", required=True, help="Header input CSV.", metavar="FILE")
 
@@ -987,13 +1089,31 @@ def main():
     parser.add_argument("--cytometry", "-c", help="Cytometry input file.", metavar="FILE")
     parser.add_argument("--part-placement-rules", "-x", dest="part_placement_rules", help="Part placement rules input file.", metavar="FILE")
     parser.add_argument("--gate-placement-rules", "-y", dest="gate_placement_rules", help="Gate placement rules input file.", metavar="FILE")
+    parser.add_argument("--reduce-rules", dest="reduce_rules", action='store_true', help="Drop repeated placement rules and BEFORE rules implied by the others.")
 
     group = parser.add_argument_group('genetic locations')
     group.add_argument("--genetic-locations-name", "-n", dest="genetic_locations_name", action='append', help="Genetic locations annotation name.", metavar="STRING")
     group.add_argument("--genetic-locations-file", "-o", dest="genetic_locations_file", action='append', help="Genetic locations input file.", metavar="FILE")
     group.add_argument("--genetic-locations", "-q", dest="genetic_locations", help="Genetic locations settings CSV.")
-    args = parser.parse_args()
-    
+
+    parser.add_argument("--columnar", action='store_true', help="Load the toxicity and cytometry CSVs with the columnar (NumPy) loaders and report their throughput.")
+
+    parser.add_argument("--jobs", "-j", type=int, default=1, help="Parse the gates, response functions, gate parts, parts, toxicity and cytometry inputs in N parallel processes.", metavar="N")
+
+    group = parser.add_argument_group('output')
+    group.add_argument("--outfile", help="Write the UCF to this file instead of standard output.", metavar="FILE")
+    group.add_argument("--compact", action='store_true', help="Write the UCF without indentation or whitespace.")
+    group.add_argument("--dedup-sequences", dest="dedup_sequences", action='store_true', help="Write each distinct part sequence once, in a dna_sequences collection, and refer to it from the parts by SHA-256 digest.")
+    group.add_argument("--cytometry-sidecar", dest="cytometry_sidecar", help="Write the cytometry bins and counts to this binary file and reference them from the UCF.", metavar="FILE")
+    group.add_argument("--location-store", dest="location_store", help="Write the genetic location sequences to this chunked, compressed file and reference them from the UCF.", metavar="FILE")
+    group.add_argument("--offset-index", dest="offset_index", action='store_true', help="Also write the byte-offset index of the UCF (OUTFILE.offsets) for random access to its collections.")
+
+    parser.add_argument("--validate", action='store_true', help="Check that every gate has its collections and every referenced part exists, and report all duplicates and dangling references.")
+
+    parser.add_argument("--cache-dir", dest="cache_dir", help="Cache the collections built from each input here, keyed by the input's content, and reuse them in later builds.", metavar="DIR")
+    return parser
+
+def check_arguments(parser,args):
     if args.genetic_locations_name and args.genetic_locations_file is None:
         parser.error("--genetic-locations-name requires --genetic-locations-file.")
     elif args.genetic_locations_file and args.genetic_locations_name is None:
@@ -1001,39 +1121,184 @@ def main():
     elif args.genetic_locations_name and args.genetic_locations_file \
          and len(args.genetic_locations_name) != len(args.genetic_locations_file):
         parser.error("Every specification of --genetic-locations-name requires an accompanying --genetic-locations-file.")
-    
-    ucf = []
-    if args.header:
-        ucf = add_header(args.header,ucf)
-    if args.measurement_std:
-        ucf = add_measurement_standard(args.measurement_std,ucf)
-    if args.measurement_plasmid:
-        ucf = add_measurement_plasmid(args.measurement_plasmid,ucf)
+
+    if args.columnar:
+        try:
+            import ucf_columnar
+        except ImportError:
+            parser.error("--columnar requires numpy.")
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1.")
+    if args.offset_index and not args.outfile:
+        parser.error("--offset-index requires --outfile.")
+
+def build_plan(args):
+    """The (function,args,inputs) calls of a build, as the lists of
+    sections, independent stages, rules and locations."""
+    if args.columnar:
+        import ucf_columnar
+
+    # each section is a list of (function,args,inputs) stages whose
+    # collections are finished once the section has run, so they are
+    # written (or cached) as a unit
+    sections = []
+    if args.measurement_std or args.measurement_plasmid:
+        calls = []
+        if args.measurement_std:
+            calls.append((add_measurement_standard,[args.measurement_std],[args.measurement_std]))
+        if args.measurement_plasmid:
+            calls.append((add_measurement_plasmid,[args.measurement_plasmid],[args.measurement_plasmid]))
+        sections.append(calls)
     if args.logic_constraints:
-        ucf = add_logic_constraints(args.logic_constraints,ucf)
+        sections.append([(add_logic_constraints,[args.logic_constraints],[args.logic_constraints])])
     if args.motif_library:
-        ucf = add_motif_library(args.motif_library,ucf)
+        sections.append([(add_motif_library,[args.motif_library],[args.motif_library])])
     if args.std_motif_library:
-        ucf = add_standard_motif_library(ucf)
-    ucf = add_gates(args.gates,ucf)
-    ucf = add_response_functions(args.response_functions,ucf)
-    ucf = add_gate_parts(args.gate_parts,ucf)
-    ucf = add_parts(args.parts,ucf)
+        sections.append([(add_standard_motif_library,[],[STD_MOTIF_LIBRARY])])
+
+    # these sections only append collections built from their own input
+    # file, so they can run in any order (or concurrently) as long as their
+    # results are written in this order
+    stages = [[(add_gates,[args.gates],[args.gates])],
+              [(add_response_functions,[args.response_functions],[args.response_functions])],
+              [(add_gate_parts,[args.gate_parts],[args.gate_parts])],
+              [(add_parts,[args.parts],[args.parts])]]
     if args.toxicity:
-        ucf = add_toxicity(args.toxicity,ucf)
+        if args.columnar:
+            stages.append([(functools.partial(add_columnar,ucf_columnar.add_toxicity),[args.toxicity],[args.toxicity])])
+        else:
+            stages.append([(add_toxicity,[args.toxicity],[args.toxicity])])
     if args.cytometry:
-        ucf = add_cytometry(args.cytometry,ucf)
+        if args.columnar:
+            stages.append([(functools.partial(add_columnar,ucf_columnar.add_cytometry),[args.cytometry],[args.cytometry])])
+        else:
+            stages.append([(add_cytometry,[args.cytometry],[args.cytometry])])
+
+    rules = []
     if args.part_placement_rules:
-        ucf = add_part_placement_rules(args.part_placement_rules,ucf)
+        rules.append((add_part_placement_rules,[args.part_placement_rules],[args.part_placement_rules]))
     if args.gate_placement_rules:
-        ucf = add_gate_placement_rules(args.gate_placement_rules,ucf)
+        rules.append((add_gate_placement_rules,[args.gate_placement_rules],[args.gate_placement_rules]))
+    if args.reduce_rules and len(rules) > 0:
+        rules.append((reduce_placement_rules,[],[]))
+
+    locations = []
     if args.genetic_locations_name:
         for (name,filename) in zip(args.genetic_locations_name,args.genetic_locations_file):
-            ucf = add_genetic_locations_files(filename,name,ucf)
+            locations.append((add_genetic_locations_files,[filename,name],[filename]))
     if args.genetic_locations:
-        ucf = add_genetic_locations(args.genetic_locations,ucf)
+        locations.append((add_genetic_locations,[args.genetic_locations],[args.genetic_locations]))
+
+    return sections, stages, rules, locations
+
+def write_ucf(args,sections,stages,rules,locations,build=None):
+    """Build the collections of a plan and write the UCF; returns the
+    --validate problems.
+
+    build(calls) supplies the collections of each section, by default
+    build_section() with the --cache-dir, running the stages in --jobs
+    processes.
+    """
+    # an --outfile is written to a temporary file that replaces it only
+    # once the whole UCF is written and valid, so a failed build leaves it
+    # untouched
+    if args.outfile:
+        tmp_file = "%s.%d.tmp" % (args.outfile,os.getpid())
+        outfile = open(tmp_file,'w')
+    else:
+        outfile = sys.stdout
+    try:
+        problems = _write_collections(args,outfile,sections,stages,rules,locations,build)
+    except BaseException:
+        if args.outfile:
+            outfile.close()
+            os.remove(tmp_file)
+        raise
+    if args.outfile:
+        outfile.close()
+        if len(problems) > 0:
+            os.remove(tmp_file)
+            return problems
+        os.replace(tmp_file,args.outfile)
+        if args.offset_index:
+            ucf_index.write(args.outfile)
+    return problems
+
+def _write_collections(args,outfile,sections,stages,rules,locations,build):
+    executor = None
+    if build is not None:
+        results = (build(calls) for calls in stages)
+    elif args.jobs > 1:
+        executor = ProcessPoolExecutor(max_workers=args.jobs)
+        futures = [executor.submit(build_section,calls,args.cache_dir) for calls in stages]
+        results = (future.result() for future in futures)
+    else:
+        results = (build_section(calls,args.cache_dir) for calls in stages)
+    if build is None:
+        build = functools.partial(build_section,cache_dir=args.cache_dir)
+
+    # every collection is written as soon as no later stage can modify it,
+    # so only one group of collections is in memory at a time
+    writer = UCFWriter(outfile,args.compact)
+
+    sidecar = None
+    if args.cytometry_sidecar:
+        name = args.cytometry_sidecar
+        if args.outfile:
+            name = os.path.relpath(os.path.abspath(name),os.path.dirname(os.path.abspath(args.outfile)))
+        sidecar = CytometrySidecar(args.cytometry_sidecar,name)
+
+    locations_store = None
+    if args.location_store:
+        name = args.location_store
+        if args.outfile:
+            name = os.path.relpath(os.path.abspath(name),os.path.dirname(os.path.abspath(args.outfile)))
+        locations_store = LocationSequences(args.location_store,name)
+
+    validator = Validator() if args.validate else None
+    store = SequenceStore() if args.dedup_sequences else None
+
+    def write(collections):
+        if store is not None:
+            collections = dedup_sequences(store,collections)
+        if validator is not None:
+            validator.add(collections)
+        if sidecar is not None:
+            collections = sidecar.write(collections)
+        if locations_store is not None:
+            collections = locations_store.write(collections)
+        writer.write(collections)
+
+    # the header is not cached, its date defaults to the build time
+    write(add_header(args.header,[]))
+    for calls in sections:
+        write(build(calls))
+    for collections in results:
+        write(collections)
+    if executor is not None:
+        executor.shutdown()
+    for calls in [rules,locations]:
+        if len(calls) > 0:
+            write(build(calls))
+
+    writer.close()
+    if sidecar is not None:
+        sidecar.close()
+    if locations_store is not None:
+        locations_store.close()
+
+    return validator.problems() if validator is not None else []
+
+def main():
+    parser = argument_parser()
+    args = parser.parse_args()
+    check_arguments(parser,args)
 
-    print(json.dumps(ucf,indent=2))
+    problems = write_ucf(args,*build_plan(args))
+    for problem in problems:
+        sys.stderr.write(problem + "\n")
+    if len(problems) > 0:
+        raise SystemExit(1)
 
 if __name__ == "__main__":
     main()
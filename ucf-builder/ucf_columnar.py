@@ -0,0 +1,158 @@
+import csv
+import numpy
+
+from csv_schema import Schema, Column
+
+__author__  = 'Timothy S. Jones <jonests@bu.edu>, Densmore Lab, BU'
+__license__ = 'GPL3'
+
+# Columnar versions of the toxicity and cytometry loaders in
+# ucf_builder. The whole file is read into typed arrays in one pass, rows
+# are grouped with a stable sort, and the groups are only converted to
+# JSON lists when the collections are built. The collections are equal,
+# and serialize identically, to those of the row-at-a-time loaders.
+
+def _header_columns(filename,keys):
+    with open(filename,'r',newline='') as csvfile:
+        header = next(csv.reader(csvfile,delimiter=','))
+
+    decoder = Schema([Column(key) for key in keys]).compile(header,filename)
+    return [decoder.columns[key] for key in keys]
+
+def _load_columns(filename,keys,types):
+    columns = _header_columns(filename,keys)
+    dtype = [(key,t) for key,t in zip(keys,types)]
+    try:
+        table = numpy.loadtxt(filename,delimiter=',',quotechar='"',skiprows=1,
+                              usecols=columns,dtype=dtype,ndmin=1)
+    except ValueError as e:
+        raise RuntimeError("%s: %s" % (filename,e))
+    return table
+
+def _codes(values):
+    # number the distinct values in order of first appearance
+    uniques, first, inverse = numpy.unique(values,return_index=True,return_inverse=True)
+    rank = numpy.empty(len(first),dtype=numpy.int64)
+    rank[numpy.argsort(first,kind='stable')] = numpy.arange(len(first))
+    return rank[inverse.reshape(-1)], len(first)
+
+def _groups(*keys):
+    # split the row indexes by the combined key, groups in order of first
+    # appearance and rows in file order within each group; the combined key
+    # is renumbered after each key so it stays below the row count
+    group = numpy.zeros(len(keys[0]),dtype=numpy.int64)
+    for key in keys:
+        codes, n = _codes(key)
+        group, _ = _codes(group * n + codes)
+    order = numpy.argsort(group,kind='stable')
+    bounds = numpy.flatnonzero(numpy.diff(group[order])) + 1
+    return numpy.split(order,bounds) if len(order) > 0 else []
+
+def _check_names(table,key,message):
+    if len(table) > 0 and (table[key] == '').any():
+        raise RuntimeError(message)
+
+def add_toxicity(filename,ucf,stats=None):
+    ###############
+    # header keys #
+    ###############
+    S_CSV_GATE_NAME = "gate_name"
+    S_CSV_VARIABLE_NAME = "variable"
+    S_CSV_INPUT = "input"
+    S_CSV_GROWTH = "growth"
+
+    ############
+    # ucf keys #
+    ############
+    S_UCF_COLLECTION = "collection"
+    S_UCF_TOXICITY = "gate_toxicity"
+    S_UCF_GATE_NAME = "gate_name"
+    S_UCF_VARIABLE_NAME = "maps_to_variable"
+    S_UCF_INPUT = "input"
+    S_UCF_GROWTH = "growth"
+
+    table = _load_columns(filename,
+                          [S_CSV_GATE_NAME,S_CSV_VARIABLE_NAME,S_CSV_INPUT,S_CSV_GROWTH],
+                          [object,object,numpy.float64,numpy.float64])
+    _check_names(table,S_CSV_GATE_NAME,"Gate name not specified.")
+    _check_names(table,S_CSV_VARIABLE_NAME,"Variable name not specified.")
+
+    gate_names = table[S_CSV_GATE_NAME]
+    variables = table[S_CSV_VARIABLE_NAME]
+    inputs = table[S_CSV_INPUT]
+    growths = table[S_CSV_GROWTH]
+
+    toxicity = []
+    for rows in _groups(gate_names,variables):
+        first = rows[0]
+        collection = {S_UCF_COLLECTION: S_UCF_TOXICITY,
+                      S_UCF_GATE_NAME: gate_names[first],
+                      S_UCF_VARIABLE_NAME: variables[first],
+                      S_UCF_INPUT: inputs[rows].tolist(),
+                      S_UCF_GROWTH: growths[rows].tolist()}
+        toxicity.append(collection)
+
+    if stats is not None:
+        stats['rows'] = len(table)
+
+    ucf += toxicity
+    return ucf
+
+def add_cytometry(filename,ucf,stats=None):
+    ###############
+    # header keys #
+    ###############
+    S_CSV_GATE_NAME = 'gate_name'
+    S_CSV_VARIABLE = 'variable'
+    S_CSV_INPUT = 'input'
+    S_CSV_OUTPUT_BIN = 'bin'
+    S_CSV_OUTPUT_COUNT = 'count'
+
+    ############
+    # ucf keys #
+    ############
+    S_UCF_COLLECTION = 'collection'
+    S_UCF_CYTOMETRY = 'gate_cytometry'
+    S_UCF_GATE_NAME = 'gate_name'
+    S_UCF_VARIABLE = 'maps_to_variable'
+    S_UCF_INPUT = 'input'
+    S_UCF_OUTPUT_BIN = 'output_bins'
+    S_UCF_OUTPUT_COUNT = 'output_counts'
+    S_UCF_CYTOMETRY_DATA = 'cytometry_data'
+
+    table = _load_columns(filename,
+                          [S_CSV_GATE_NAME,S_CSV_VARIABLE,S_CSV_INPUT,S_CSV_OUTPUT_BIN,S_CSV_OUTPUT_COUNT],
+                          [object,object,numpy.float64,numpy.float64,numpy.float64])
+    _check_names(table,S_CSV_GATE_NAME,"Gate name not specified.")
+    _check_names(table,S_CSV_VARIABLE,"'%s' name not specified." % S_CSV_VARIABLE)
+
+    gate_names = table[S_CSV_GATE_NAME]
+    variables = table[S_CSV_VARIABLE]
+    inputs = table[S_CSV_INPUT]
+    output_bins = table[S_CSV_OUTPUT_BIN]
+    output_counts = table[S_CSV_OUTPUT_COUNT]
+
+    # a gate's entries are contiguous in neither the groups nor the file,
+    # so the collections are looked up by name
+    cytometry = {}
+    for rows in _groups(gate_names,variables,inputs):
+        first = rows[0]
+        gate_name = gate_names[first]
+        collection = cytometry.get(gate_name)
+        if collection is None:
+            collection = {S_UCF_COLLECTION: S_UCF_CYTOMETRY,
+                          S_UCF_GATE_NAME: gate_name,
+                          S_UCF_CYTOMETRY_DATA: []}
+            cytometry[gate_name] = collection
+
+        data = {S_UCF_VARIABLE: variables[first],
+                S_UCF_INPUT: float(inputs[first]),
+                S_UCF_OUTPUT_BIN: output_bins[rows].tolist(),
+                S_UCF_OUTPUT_COUNT: output_counts[rows].tolist()}
+        collection[S_UCF_CYTOMETRY_DATA].append(data)
+
+    if stats is not None:
+        stats['rows'] = len(table)
+
+    ucf += cytometry.values()
+    return ucf
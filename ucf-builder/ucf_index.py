@@ -0,0 +1,161 @@
+import os
+import sys
+import json
+import mmap
+import argparse
+
+import ucf_model
+import ucf_stream
+
+__author__  = 'Timothy S. Jones <jonests@bu.edu>, Densmore Lab, BU'
+__license__ = 'GPL3'
+
+# Byte-offset index of the collections of a UCF.
+#
+# The index is a JSON sidecar next to the UCF (FILE.offsets) that lists,
+# for each collection of the top-level array, its collection type,
+# gate_name and name and the byte range of its object in the file. It is
+# stamped with the size and modification time of the UCF, and rebuilt by a
+# ucf_stream scan when either has changed. UCFIndex memory-maps the UCF and
+# decodes only the objects it is asked for, so finding a gate does not read
+# the rest of the file.
+
+INDEX_VERSION = 1
+SUFFIX = '.offsets'
+
+S_UCF_COLLECTION = ucf_stream.S_UCF_COLLECTION
+S_UCF_GATE_NAME = ucf_stream.S_UCF_GATE_NAME
+S_UCF_NAME = ucf_stream.S_UCF_NAME
+
+def index_filename(filename):
+    return filename + SUFFIX
+
+def _stamp(filename):
+    stat = os.stat(filename)
+    return stat.st_size, stat.st_mtime_ns
+
+def build(filename):
+    """Scan a UCF and return its index."""
+    (size,mtime) = _stamp(filename)
+    entries = []
+    with open(filename,'rb') as ucf_file:
+        for (offset,data,fields) in ucf_stream.scan(ucf_file):
+            entries.append([fields.get(S_UCF_COLLECTION),fields.get(S_UCF_GATE_NAME),fields.get(S_UCF_NAME),
+                            offset,len(data)])
+    return {'version': INDEX_VERSION,'size': size,'mtime_ns': mtime,'entries': entries}
+
+def write(filename):
+    """Build the index of a UCF and write it next to the UCF."""
+    index = build(filename)
+    index_file = index_filename(filename)
+    tmp_file = "%s.%d.tmp" % (index_file,os.getpid())
+    with open(tmp_file,'w') as jsonfile:
+        json.dump(index,jsonfile)
+    os.replace(tmp_file,index_file)
+    return index
+
+def read(filename):
+    """The index of a UCF if it is current, otherwise None."""
+    try:
+        with open(index_filename(filename),'r') as jsonfile:
+            index = json.load(jsonfile)
+        if index['version'] == INDEX_VERSION and [index['size'],index['mtime_ns']] == list(_stamp(filename)):
+            return index
+    except (OSError,ValueError,KeyError):
+        pass
+    return None
+
+class UCFIndex:
+    """Random access to the collections of a UCF through its index."""
+
+    def __init__(self,filename,update=True):
+        index = read(filename)
+        if index is None:
+            if not update:
+                raise RuntimeError("No current index for %s." % filename)
+            try:
+                index = write(filename)
+            except OSError:
+                # e.g. a read-only UCF directory, index it in memory only
+                index = build(filename)
+        self.filename = filename
+        self.entries = index['entries']
+        self._file = open(filename,'rb')
+        self._map = mmap.mmap(self._file.fileno(),0,access=mmap.ACCESS_READ)
+        self._keys = {}
+        for (i,(collection,gate_name,name,offset,length)) in enumerate(self.entries):
+            for key in (gate_name,name):
+                if key is not None:
+                    self._keys.setdefault((collection,key),i)
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def collection_types(self):
+        types = {}
+        for entry in self.entries:
+            types.setdefault(entry[0])
+        return list(types)
+
+    def _decode(self,entry):
+        return json.loads(self._encoded(entry))
+
+    def _encoded(self,entry):
+        offset = entry[3]
+        return self._map[offset:offset + entry[4]]
+
+    def encoded(self,i):
+        """The bytes of the i-th collection, as they are in the UCF."""
+        return self._encoded(self.entries[i])
+
+    def get(self,collection,key):
+        """The collection of the type with the gate_name or name key, or None."""
+        i = self._keys.get((collection,key))
+        return None if i is None else self._decode(self.entries[i])
+
+    def collections(self,collection=None,gate_name=None,name=None):
+        """The collections matching every filter given, decoded, as
+        ucf_stream.collections()."""
+        where = ucf_stream._where(collection,gate_name,name)
+        found = []
+        for entry in self.entries:
+            fields = {key: value for (key,value) in zip((S_UCF_COLLECTION,S_UCF_GATE_NAME,S_UCF_NAME),entry)
+                      if value is not None}
+            if where(fields):
+                found.append(self._decode(entry))
+        return found
+
+    def load(self,collection=None,gate_name=None,name=None,packed_sequences=False):
+        """A ucf_model.UCF of only the collections that match."""
+        return ucf_model.UCF(self.collections(collection,gate_name,name),
+                             os.path.dirname(os.path.abspath(self.filename)),packed_sequences)
+
+def load(filename,collection=None,gate_name=None,name=None,packed_sequences=False):
+    """A ucf_model.UCF of the matching collections of a UCF, read through
+    its index (written first if it is missing or stale)."""
+    index = UCFIndex(filename)
+    try:
+        return index.load(collection,gate_name,name,packed_sequences)
+    finally:
+        index.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Write the byte-offset index of UCF files.")
+    parser.add_argument("ucf", nargs='+', help="UCF files to index.", metavar="FILE")
+    parser.add_argument("--force", "-f", action='store_true', help="Rewrite indexes that are still current.")
+    args = parser.parse_args()
+
+    for filename in args.ucf:
+        index = None if args.force else read(filename)
+        if index is None:
+            index = write(filename)
+            sys.stderr.write("%s: %d collections indexed\n" % (filename,len(index['entries'])))
+        else:
+            sys.stderr.write("%s: index is current\n" % filename)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+import os
+import sys
+import json
+import mmap
+from array import array
+
+from sequence_store import SequenceStore
+from location_store import LocationStore
+import genbank
+
+__author__  = 'Timothy S. Jones <jonests@bu.edu>, Densmore Lab, BU'
+__license__ = 'GPL3'
+
+# An indexed, read-side model of a UCF. The collections are loaded once
+# and indexed by collection type, by (collection, gate_name) and by
+# (collection, name), so lookups do not scan the list. Parts, toxicity and
+# cytometry are converted to __slots__ records with their numbers held in
+# array('d') instead of lists of float objects, and any keys a record does
+# not model are kept in its extra dict; every other collection is kept as
+# the dict it was loaded from. as_list() gives back the collections the UCF
+# was loaded from, except that sidecar references are read into lists.
+#
+# Cytometry bins and counts may also live in a binary sidecar written by
+# ucf_builder --cytometry-sidecar, in which case the UCF holds references
+# of the form {"sidecar": FILE, "offset": BYTES, "length": N} and the
+# sidecar is memory-mapped, so only the pages of the gates that are used
+# are ever read.
+#
+# Part sequences are interned in a sequence_store.SequenceStore, so equal
+# sequences are held once (optionally 2-bit packed) and compare by digest.
+# UCFs built with ucf_builder --dedup-sequences, whose parts carry a
+# dnasequence_sha256 resolved by a dna_sequences collection, load the same
+# way.
+#
+# The sequence of a genetic location is read with location_sequence(),
+# from the GenBank lines in the UCF or, for UCFs built with ucf_builder
+# --location-store, from the chunks of the store file that cover the range.
+
+S_UCF_COLLECTION = 'collection'
+S_UCF_GATE_NAME = 'gate_name'
+S_UCF_NAME = 'name'
+
+S_UCF_DNA_SEQUENCES = 'dna_sequences'
+S_UCF_SEQUENCES = 'sequences'
+
+S_SIDECAR = 'sidecar'
+S_SIDECAR_OFFSET = 'offset'
+S_SIDECAR_LENGTH = 'length'
+
+class Sidecar:
+    """Read-only memory map of a little-endian float64 sidecar file."""
+
+    def __init__(self,filename):
+        with open(filename,'rb') as f:
+            if os.fstat(f.fileno()).st_size > 0:
+                self._map = mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+                self._view = memoryview(self._map)
+            else:
+                self._map = None
+                self._view = memoryview(b'')
+
+    def read(self,offset,length):
+        values = self._view[offset:offset + 8 * length]
+        if len(values) != 8 * length:
+            raise RuntimeError("Sidecar reference past the end of the file.")
+        if sys.byteorder == 'little':
+            return values.cast('d')
+        values = array('d',values.tobytes())
+        values.byteswap()
+        return values
+
+def _values(values,ucf):
+    if isinstance(values,dict):
+        sidecar = ucf.sidecar(values[S_SIDECAR])
+        return sidecar.read(values[S_SIDECAR_OFFSET],values[S_SIDECAR_LENGTH])
+    return array('d',values)
+
+def _extra(collection,keys):
+    # the keys of a collection that its record does not model
+    return {k: v for (k,v) in collection.items() if k not in keys}
+
+class Part:
+    __slots__ = ('name','type','digest','_sequences','extra')
+
+    # dnasequence_sha256 is left in extra, so a part of a UCF built with
+    # --dedup-sequences is written back by digest
+    KEYS = (S_UCF_COLLECTION,S_UCF_NAME,'type','dnasequence')
+
+    def __init__(self,name,type,digest,sequences,extra=None):
+        self.name = name
+        self.type = type
+        self.digest = digest
+        self._sequences = sequences
+        self.extra = extra if extra is not None else {}
+
+    @property
+    def dnasequence(self):
+        return self._sequences.get(self.digest)
+
+    @classmethod
+    def from_dict(cls,collection,ucf):
+        if 'dnasequence_sha256' in collection:
+            digest = collection['dnasequence_sha256']
+        else:
+            digest = ucf.sequences.add(collection['dnasequence'])
+        return cls(collection['name'],collection['type'],digest,ucf.sequences,_extra(collection,cls.KEYS))
+
+    def as_dict(self):
+        d = {'collection': 'parts',
+             'name': self.name,
+             'type': self.type}
+        if 'dnasequence_sha256' not in self.extra:
+            d['dnasequence'] = self.dnasequence
+        d.update(self.extra)
+        return d
+
+class Toxicity:
+    __slots__ = ('gate_name','variable','input','growth','extra')
+
+    KEYS = (S_UCF_COLLECTION,S_UCF_GATE_NAME,'maps_to_variable','input','growth')
+
+    def __init__(self,gate_name,variable,input,growth,extra=None):
+        self.gate_name = gate_name
+        self.variable = variable
+        self.input = array('d',input)
+        self.growth = array('d',growth)
+        self.extra = extra if extra is not None else {}
+
+    @classmethod
+    def from_dict(cls,collection,ucf):
+        return cls(collection['gate_name'],collection['maps_to_variable'],
+                   collection['input'],collection['growth'],_extra(collection,cls.KEYS))
+
+    def as_dict(self):
+        d = {'collection': 'gate_toxicity',
+             'gate_name': self.gate_name,
+             'maps_to_variable': self.variable,
+             'input': self.input.tolist(),
+             'growth': self.growth.tolist()}
+        d.update(self.extra)
+        return d
+
+class CytometryData:
+    __slots__ = ('variable','input','bins','counts','extra')
+
+    KEYS = ('maps_to_variable','input','output_bins','output_counts')
+
+    def __init__(self,variable,input,bins,counts,extra=None):
+        # bins and counts are array('d') or, for sidecar data, memoryviews
+        # of the mapped file
+        self.variable = variable
+        self.input = input
+        self.bins = bins
+        self.counts = counts
+        self.extra = extra if extra is not None else {}
+
+    @classmethod
+    def from_dict(cls,data,ucf):
+        return cls(data['maps_to_variable'],data['input'],
+                   _values(data['output_bins'],ucf),
+                   _values(data['output_counts'],ucf),
+                   _extra(data,cls.KEYS))
+
+    def as_dict(self):
+        d = {'maps_to_variable': self.variable,
+             'input': self.input,
+             'output_bins': self.bins.tolist(),
+             'output_counts': self.counts.tolist()}
+        d.update(self.extra)
+        return d
+
+class Cytometry:
+    __slots__ = ('gate_name','data','extra')
+
+    KEYS = (S_UCF_COLLECTION,S_UCF_GATE_NAME,'cytometry_data')
+
+    def __init__(self,gate_name,data,extra=None):
+        self.gate_name = gate_name
+        self.data = data
+        self.extra = extra if extra is not None else {}
+
+    @classmethod
+    def from_dict(cls,collection,ucf):
+        return cls(collection['gate_name'],
+                   [CytometryData.from_dict(d,ucf) for d in collection['cytometry_data']],
+                   _extra(collection,cls.KEYS))
+
+    def as_dict(self):
+        d = {'collection': 'gate_cytometry',
+             'gate_name': self.gate_name,
+             'cytometry_data': [d.as_dict() for d in self.data]}
+        d.update(self.extra)
+        return d
+
+RECORDS = {'parts': Part,
+           'gate_toxicity': Toxicity,
+           'gate_cytometry': Cytometry}
+
+class UCF:
+    """Indexed UCF.
+
+    Records keep the order of the source list. Collections with a gate_name
+    are indexed by (collection, gate_name), those with a name by
+    (collection, name); a key may map to several records (e.g. the toxicity
+    of each variable of a gate).
+    """
+
+    def __init__(self,collections,basedir=None,packed_sequences=False):
+        # sidecar file names are relative to the directory of the UCF
+        self._basedir = basedir
+        self._sidecars = {}
+        self._location_stores = {}
+        self.sequences = SequenceStore(packed_sequences)
+        self._records = []
+        self._by_collection = {}
+        self._by_gate = {}
+        self._by_name = {}
+        for c in collections:
+            self._add(c)
+
+    @classmethod
+    def load(cls,filename,packed_sequences=False):
+        with open(filename,'r') as ucf_file:
+            return cls(json.load(ucf_file),os.path.dirname(os.path.abspath(filename)),packed_sequences)
+
+    def sidecar(self,name):
+        sidecar = self._sidecars.get(name)
+        if sidecar is None:
+            sidecar = self._sidecars[name] = Sidecar(self._path(name))
+        return sidecar
+
+    def _path(self,name):
+        if self._basedir is not None:
+            return os.path.join(self._basedir,name)
+        return name
+
+    def location_store(self,name):
+        store = self._location_stores.get(name)
+        if store is None:
+            store = self._location_stores[name] = LocationStore(self._path(name))
+        return store
+
+    def location_sequence(self,name,start=1,end=None):
+        """Bases start..end (1-based, inclusive) of a genetic location."""
+        for c in self.collections('genetic_locations'):
+            for location in c.get('locations',[]):
+                if location.get(S_UCF_NAME) != name:
+                    continue
+                reference = location.get('sequence')
+                if reference is not None:
+                    store = self.location_store(reference['store'])
+                    return store.read(reference['location'],start,end)
+                record = genbank.parse(location['file'],name)
+                sequence = record.sequence or ''
+                if end is None:
+                    end = len(sequence)
+                if start < 1 or end > len(sequence) or start > len(sequence) + 1 or (start > end + 1 and not record.circular):
+                    raise RuntimeError("Range %d..%d outside the %d bp of '%s'." % (start,end,len(sequence),name))
+                if start > end + 1:
+                    # across the origin of a circular location
+                    return sequence[start - 1:] + sequence[:end]
+                return sequence[start - 1:end]
+        raise RuntimeError("No genetic location '%s'." % name)
+
+    def _add(self,c):
+        collection = c[S_UCF_COLLECTION]
+        if collection == S_UCF_DNA_SEQUENCES:
+            for (digest,sequence) in c[S_UCF_SEQUENCES].items():
+                self.sequences.add_digest(digest,sequence)
+        if collection in RECORDS:
+            record = RECORDS[collection].from_dict(c,self)
+        else:
+            record = c
+        self._records.append(record)
+        self._by_collection.setdefault(collection,[]).append(record)
+        if S_UCF_GATE_NAME in c:
+            self._by_gate.setdefault((collection,c[S_UCF_GATE_NAME]),[]).append(record)
+        if S_UCF_NAME in c:
+            self._by_name.setdefault((collection,c[S_UCF_NAME]),[]).append(record)
+
+    def __len__(self):
+        return len(self._records)
+
+    def __iter__(self):
+        return iter(self._records)
+
+    @property
+    def collection_types(self):
+        return list(self._by_collection.keys())
+
+    def collections(self,collection):
+        """All records of a collection type."""
+        return self._by_collection.get(collection,[])
+
+    def collection(self,collection):
+        """The first record of a collection type, e.g. the header."""
+        records = self._by_collection.get(collection)
+        return records[0] if records else None
+
+    def by_gate(self,collection,gate_name):
+        return self._by_gate.get((collection,gate_name),[])
+
+    def gate(self,collection,gate_name):
+        """The first record of a collection type for a gate."""
+        records = self._by_gate.get((collection,gate_name))
+        return records[0] if records else None
+
+    def by_name(self,collection,name):
+        return self._by_name.get((collection,name),[])
+
+    def part(self,name):
+        records = self._by_name.get(('parts',name))
+        return records[0] if records else None
+
+    @property
+    def gate_names(self):
+        return [g[S_UCF_GATE_NAME] for g in self.collections('gates')]
+
+    def as_list(self):
+        """The UCF as a list of JSON-ready collections."""
+        return [r.as_dict() if hasattr(r,'as_dict') else r for r in self._records]
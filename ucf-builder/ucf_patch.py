@@ -0,0 +1,184 @@
+import os
+import sys
+import json
+import argparse
+
+import ucf_index
+import ucf_builder
+from sequence_store import SequenceStore
+from ucf_validate import validate
+
+__author__  = 'Timothy S. Jones <jonests@bu.edu>, Densmore Lab, BU'
+__license__ = 'GPL3'
+
+# Apply delta CSVs to an existing UCF.
+#
+# A delta is read by the ucf_builder loader for its format, so it has the
+# same header and checks as a full input but only the records that change.
+# The UCF is indexed by (collection, gate_name) or (collection, name) from
+# its ucf_index offsets; every record with a known key is replaced in
+# place, duplicates included, and new records go after the last record of
+# their collection type, in the order of the delta. Every other record is
+# copied byte for byte from the UCF without being parsed, so the cost of a
+# patch is the size of the delta plus a copy of the file.
+
+S_UCF_COLLECTION = 'collection'
+S_UCF_GATE_NAME = 'gate_name'
+S_UCF_NAME = 'name'
+S_UCF_DNA_SEQUENCES = 'dna_sequences'
+S_UCF_SEQUENCES = 'sequences'
+
+# option and the loader of its delta
+DELTAS = [('gates',ucf_builder.add_gates),
+          ('response_functions',ucf_builder.add_response_functions),
+          ('gate_parts',ucf_builder.add_gate_parts),
+          ('parts',ucf_builder.add_parts)]
+
+def _key(c):
+    if S_UCF_GATE_NAME in c:
+        return (c[S_UCF_COLLECTION],c[S_UCF_GATE_NAME])
+    if S_UCF_NAME in c:
+        return (c[S_UCF_COLLECTION],c[S_UCF_NAME])
+    return None
+
+def _entry_key(entry):
+    # _key() of a ucf_index entry [collection, gate_name, name, ...]
+    (collection,gate_name,name) = entry[:3]
+    if gate_name is not None:
+        return (collection,gate_name)
+    if name is not None:
+        return (collection,name)
+    return None
+
+class Patch:
+    def __init__(self,index):
+        self.index = index
+        self._positions = {}
+        self._last = {}
+        self._replacements = {}
+        self._inserts = {}
+        self._inserted = {}
+        self.replaced = 0
+        self.inserted = 0
+        self._store = None
+        for (i,entry) in enumerate(index.entries):
+            key = _entry_key(entry)
+            if key is not None:
+                self._positions.setdefault(key,[]).append(i)
+            self._last[entry[0]] = i
+        for c in index.collections(S_UCF_DNA_SEQUENCES):
+            # parts of this UCF refer to their sequences by digest
+            if self._store is None:
+                self._store = SequenceStore()
+            for (digest,sequence) in c[S_UCF_SEQUENCES].items():
+                self._store.add_digest(digest,sequence)
+
+    def apply(self,collections):
+        """Replace or insert each collection by its key."""
+        if self._store is not None:
+            known = len(self._store)
+            collections = ucf_builder.dedup_sequences(self._store,collections)
+            if len(self._store) > known:
+                # the new sequences, after the last dna_sequences collection
+                new = collections.pop()
+                self._inserts.setdefault(self._last[S_UCF_DNA_SEQUENCES],[]).append(new)
+                self.inserted += 1
+
+        for c in collections:
+            key = _key(c)
+            if key in self._positions:
+                # every copy of a duplicated record
+                for i in self._positions[key]:
+                    self._replacements[i] = c
+                self.replaced += len(self._positions[key])
+                continue
+            if key in self._inserted:
+                # a later delta for a record an earlier one inserted
+                (after,j) = self._inserted[key]
+                self._inserts[after][j] = c
+                continue
+            # after the last record of the type, or at the end for a type
+            # the UCF does not have yet
+            after = self._last.get(c[S_UCF_COLLECTION],len(self.index) - 1)
+            inserts = self._inserts.setdefault(after,[])
+            if key is not None:
+                self._inserted[key] = (after,len(inserts))
+            inserts.append(c)
+            self.inserted += 1
+
+    def _records(self):
+        # each record of the patched UCF, as a collection or, unchanged, as
+        # the bytes of the UCF
+        for c in self._inserts.get(-1,[]):
+            yield c, None
+        for i in range(len(self.index)):
+            if i in self._replacements:
+                yield self._replacements[i], None
+            else:
+                yield None, self.index.encoded(i)
+            for c in self._inserts.get(i,[]):
+                yield c, None
+
+    def result(self):
+        """The patched UCF, every record decoded."""
+        return [c if data is None else json.loads(data) for (c,data) in self._records()]
+
+    def write(self,writer):
+        """Write the patched UCF to a ucf_builder.UCFWriter."""
+        for (c,data) in self._records():
+            if data is None:
+                writer.write([c])
+            else:
+                writer.write_encoded(data.decode('utf-8'))
+        writer.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply delta CSVs to an existing UCF.")
+    parser.add_argument("ucf", help="UCF file to patch.", metavar="FILE")
+    parser.add_argument("--gates", "-g", help="Gates CSV of the gates to replace or add.", metavar="FILE")
+    parser.add_argument("--response-functions", "-f", dest="response_functions", help="Response functions CSV of the gates to replace or add.", metavar="FILE")
+    parser.add_argument("--gate-parts", "-a", dest="gate_parts", help="Gate parts CSV of the gates to replace or add.", metavar="FILE")
+    parser.add_argument("--parts", "-p", dest="parts", help="Parts CSV of the parts to replace or add.", metavar="FILE")
+    parser.add_argument("--outfile", help="Write the UCF to this file instead of standard output.", metavar="FILE")
+    parser.add_argument("--compact", action='store_true', help="Write the new and replaced records without indentation or whitespace, the others are copied as they are.")
+    parser.add_argument("--validate", action='store_true', help="Check the cross-references of the patched UCF, as ucf_builder --validate.")
+    args = parser.parse_args()
+
+    index = ucf_index.UCFIndex(args.ucf)
+    try:
+        patch = Patch(index)
+        for (option,loader) in DELTAS:
+            filename = getattr(args,option)
+            if filename:
+                patch.apply(loader(filename,[]))
+        sys.stderr.write("%d records replaced, %d inserted\n" % (patch.replaced,patch.inserted))
+
+        problems = validate(patch.result()) if args.validate else []
+        for problem in problems:
+            sys.stderr.write(problem + "\n")
+        if len(problems) > 0:
+            # an invalid patch leaves the --outfile as it was
+            raise SystemExit(1)
+
+        # written to a temporary file that replaces the --outfile only once
+        # the whole UCF is written, which may also be the UCF being read
+        if args.outfile:
+            tmp_file = "%s.%d.tmp" % (args.outfile,os.getpid())
+            outfile = open(tmp_file,'w')
+        else:
+            outfile = sys.stdout
+        try:
+            patch.write(ucf_builder.UCFWriter(outfile,args.compact))
+        except BaseException:
+            if args.outfile:
+                outfile.close()
+                os.remove(tmp_file)
+            raise
+        if args.outfile:
+            outfile.close()
+            os.replace(tmp_file,args.outfile)
+    finally:
+        index.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import os
+import re
+import json
+
+import ucf_model
+
+__author__  = 'Timothy S. Jones <jonests@bu.edu>, Densmore Lab, BU'
+__license__ = 'GPL3'
+
+# Incremental reader for the top-level array of a UCF.
+#
+# The file is read in blocks and scanned for the boundaries of each
+# collection object with one regular expression that only stops at
+# strings, braces and brackets, so the numbers that make up most of a UCF
+# (cytometry bins and counts) are skipped without being parsed. While an
+# object is scanned its top-level "collection", "gate_name" and "name"
+# values are picked out, and only objects that pass the filter are decoded
+# with json. Reading stops as soon as the requested number of collections
+# has been found.
+
+S_UCF_COLLECTION = 'collection'
+S_UCF_GATE_NAME = 'gate_name'
+S_UCF_NAME = 'name'
+
+BLOCK_SIZE = 1 << 20
+
+_STRUCTURE = re.compile(rb'["{}\[\]]')
+_STRING = re.compile(rb'"(?:[^"\\]|\\.)*"')
+_KEY = re.compile(rb'\s*:')
+_STRING_VALUE = re.compile(rb'\s*:\s*("(?:[^"\\]|\\.)*")')
+_NEXT = re.compile(rb'[^\s,]')
+_FIELDS = {('"%s"' % key).encode(): key for key in (S_UCF_COLLECTION,S_UCF_GATE_NAME,S_UCF_NAME)}
+
+def _scan_object(buf,start):
+    # the end of the object at start and its top-level fields, or None if
+    # the object continues past the buffer
+    depth = 0
+    p = start
+    keys = {}
+    while True:
+        m = _STRUCTURE.search(buf,p)
+        if m is None:
+            return None
+        p = m.end()
+        c = buf[m.start()]
+        if c == 0x22:  # '"'
+            m = _STRING.match(buf,m.start())
+            if m is None:
+                # the string runs past the buffer
+                return None
+            p = m.end()
+            if depth == 1 and m.group() in _FIELDS and _KEY.match(buf,p):
+                keys[_FIELDS[m.group()]] = p
+        elif c == 0x7b or c == 0x5b:  # '{' or '['
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                break
+    fields = {}
+    for (key,position) in keys.items():
+        value = _STRING_VALUE.match(buf,position)
+        if value:
+            fields[key] = json.loads(value.group(1))
+    return p, fields
+
+def scan(ucf_file,where=None,block_size=BLOCK_SIZE):
+    """Yield (offset, data, fields) for each collection of a UCF opened in
+    binary mode, where fields holds its collection, gate_name and name.
+
+    data is only sliced out (and fields only yielded) for the collections
+    where(fields) accepts.
+    """
+    buf = ucf_file.read(block_size)
+    eof = len(buf) == 0
+    base = 0
+
+    m = re.compile(rb'\s*\[').match(buf)
+    if m is None:
+        raise RuntimeError("A UCF must be a JSON array.")
+    pos = m.end()
+
+    while True:
+        m = _NEXT.search(buf,pos)
+        if m is None:
+            if eof:
+                raise RuntimeError("Unexpected end of UCF.")
+            more = ucf_file.read(block_size)
+            eof = len(more) == 0
+            base += pos
+            buf = buf[pos:] + more
+            pos = 0
+            continue
+        if buf[m.start()] == 0x5d:  # ']'
+            return
+        if buf[m.start()] != 0x7b:
+            raise RuntimeError("Expected a collection object at byte %d of the UCF." % (base + m.start()))
+        start = m.start()
+
+        result = _scan_object(buf,start)
+        while result is None:
+            if eof:
+                raise RuntimeError("Unexpected end of UCF.")
+            # keep the object so far, and read at least as much again so a
+            # large object is rescanned a logarithmic number of times
+            more = ucf_file.read(max(block_size,len(buf) - start))
+            eof = len(more) == 0
+            base += start
+            buf = buf[start:] + more
+            start = 0
+            result = _scan_object(buf,start)
+
+        (end,fields) = result
+        if where is None or where(fields):
+            yield base + start, buf[start:end], fields
+        pos = end
+
+def _matcher(value):
+    if value is None:
+        return None
+    if isinstance(value,str):
+        return lambda v: v == value
+    values = set(value)
+    return lambda v: v in values
+
+def _where(collection=None,gate_name=None,name=None):
+    # a test of the fields of a collection against every filter given
+    tests = [(key,_matcher(value)) for (key,value) in ((S_UCF_COLLECTION,collection),
+                                                       (S_UCF_GATE_NAME,gate_name),
+                                                       (S_UCF_NAME,name)) if value is not None]
+
+    def where(fields):
+        for (key,test) in tests:
+            if key not in fields or not test(fields[key]):
+                return False
+        return True
+    return where
+
+def collections(filename,collection=None,gate_name=None,name=None,limit=None):
+    """The collections of a UCF matching every filter given, decoded.
+
+    Each filter is one value or a collection of values. Reading stops after
+    limit collections.
+    """
+    where = _where(collection,gate_name,name)
+    if limit is not None and limit <= 0:
+        return
+    found = 0
+    with open(filename,'rb') as ucf_file:
+        for (offset,data,fields) in scan(ucf_file,where):
+            yield json.loads(data)
+            found += 1
+            if limit is not None and found >= limit:
+                return
+
+def load(filename,collection=None,gate_name=None,name=None,limit=None,packed_sequences=False):
+    """A ucf_model.UCF of only the collections that match, see collections()."""
+    return ucf_model.UCF(collections(filename,collection,gate_name,name,limit),
+                         os.path.dirname(os.path.abspath(filename)),packed_sequences)
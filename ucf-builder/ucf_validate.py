@@ -0,0 +1,128 @@
+import json
+import argparse
+
+__author__  = 'Timothy S. Jones <jonests@bu.edu>, Densmore Lab, BU'
+__license__ = 'GPL3'
+
+# Cross-reference checks for a UCF.
+#
+# The Validator is fed collections in any grouping (ucf_builder passes
+# each group as it is written, so the whole UCF is never needed in memory)
+# and only keeps names and references, in dicts. problems() then resolves
+# every reference with one lookup, so a check is linear in the number of
+# records.
+
+S_UCF_COLLECTION = 'collection'
+S_UCF_GATE_NAME = 'gate_name'
+S_UCF_NAME = 'name'
+
+# collections holding one record per gate
+PER_GATE = ['response_functions','gate_parts','gate_toxicity','gate_cytometry']
+
+class Validator:
+    def __init__(self):
+        self._gates = {}
+        self._parts = {}
+        self._per_gate = {c: {} for c in PER_GATE}
+        # (collection, owner, part) for every part reference
+        self._references = []
+        # sequence digests of the parts, and those a dna_sequences
+        # collection provides
+        self._digests = []
+        self._sequences = set()
+
+    def add(self,ucf):
+        for c in ucf:
+            collection = c[S_UCF_COLLECTION]
+            if collection == 'gates':
+                name = c[S_UCF_GATE_NAME]
+                self._gates[name] = self._gates.get(name,0) + 1
+            elif collection == 'parts':
+                name = c[S_UCF_NAME]
+                self._parts[name] = self._parts.get(name,0) + 1
+                if 'dnasequence_sha256' in c:
+                    self._digests.append((name,c['dnasequence_sha256']))
+            elif collection == 'dna_sequences':
+                self._sequences.update(c['sequences'].keys())
+            elif collection in self._per_gate:
+                key = c[S_UCF_GATE_NAME]
+                if collection == 'gate_toxicity':
+                    key = (key,c.get('maps_to_variable'))
+                counts = self._per_gate[collection]
+                counts[key] = counts.get(key,0) + 1
+                if collection == 'gate_parts':
+                    self._add_gate_parts(c)
+            elif collection in ('input_sensors','output_reporters'):
+                owner = c.get(S_UCF_NAME)
+                if 'promoter' in c:
+                    self._references.append((collection,owner,c['promoter']))
+                for part in c.get('parts',[]):
+                    self._references.append((collection,owner,part))
+
+    def _add_gate_parts(self,c):
+        owner = c[S_UCF_GATE_NAME]
+        for cassette in c.get('expression_cassettes',[]):
+            for part in cassette.get('cassette_parts',[]):
+                self._references.append(('gate_parts',owner,part))
+        if 'promoter' in c:
+            self._references.append(('gate_parts',owner,c['promoter']))
+
+    def problems(self):
+        """Every duplicate and dangling reference, as messages."""
+        problems = []
+
+        for (name,count) in self._gates.items():
+            if count > 1:
+                problems.append("Gate '%s' specified %d times." % (name,count))
+        for (name,count) in self._parts.items():
+            if count > 1:
+                problems.append("Part '%s' specified %d times." % (name,count))
+
+        for collection in PER_GATE:
+            counts = self._per_gate[collection]
+            gates_with = set()
+            for (key,count) in counts.items():
+                gate_name = key[0] if isinstance(key,tuple) else key
+                gates_with.add(gate_name)
+                if count > 1:
+                    problems.append("%s for '%s' specified %d times." % (collection,gate_name,count))
+                if gate_name not in self._gates:
+                    problems.append("%s for unknown gate '%s'." % (collection,gate_name))
+            # toxicity and cytometry are optional inputs, only require them
+            # for every gate when the UCF has them at all
+            if len(counts) == 0 and collection in ('gate_toxicity','gate_cytometry'):
+                continue
+            for name in self._gates:
+                if name not in gates_with:
+                    problems.append("Gate '%s' has no %s." % (name,collection))
+
+        for (collection,owner,part) in self._references:
+            if part not in self._parts:
+                problems.append("%s of '%s' references unknown part '%s'." % (collection,owner,part))
+
+        for (name,digest) in self._digests:
+            if digest not in self._sequences:
+                problems.append("Part '%s' references unknown sequence '%s'." % (name,digest))
+
+        return problems
+
+def validate(ucf):
+    validator = Validator()
+    validator.add(ucf)
+    return validator.problems()
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the cross-references of a UCF.")
+    parser.add_argument("ucf", help="UCF file.", metavar="FILE")
+    args = parser.parse_args()
+
+    with open(args.ucf,'r') as ucf_file:
+        problems = validate(json.load(ucf_file))
+
+    for problem in problems:
+        print(problem)
+    if len(problems) > 0:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
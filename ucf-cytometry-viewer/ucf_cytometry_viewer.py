@@ -1,48 +1,159 @@
-import json
+import os
+import sys
 import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy
+import matplotlib
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
+from matplotlib.backends.backend_pdf import PdfPages
+from matplotlib.patches import Polygon
 
-parser = argparse.ArgumentParser(description='Plot the cytometry histograms of a gate from a UCF.')
-parser.add_argument('-u','--ucf',required=True,help='UCF file')
-parser.add_argument('-g','--gate',required=True,help='gate')
-parser.add_argument('-o','--outfile',help='output file basename')
-args = parser.parse_args()
-
-with open(args.ucf,'r') as ucf_file:
-    ucf = json.load(ucf_file)
-
-cytometry = {}
-
-for x in ucf:
-    if x['collection'] == 'gate_cytometry':
-         if x['gate_name'] == args.gate:
-             for data in x['cytometry_data']:
-                 cytometry[data['input']] = {'bins'  : data['output_bins'],
-                                             'counts': data['output_counts']}
-         else:
-             pass
-
-fig, ax = plt.subplots(len(cytometry),1,sharex=True)
-
-for i,key in enumerate(sorted(cytometry.keys())):
-    ax[i].bar(cytometry[key]['bins'],cytometry[key]['counts'])
-    ax[i].text(0.85,0.5,key,ha='left',va='center',transform=ax[i].transAxes)
-    ax[i].set_xscale('log')
-    ax[i].set_yticklabels([])
-    if i == len(cytometry) - 1:
-        axis = "y"
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),os.pardir,'ucf-builder'))
+import ucf_index
+
+def read_cytometry(ucf,gate):
+    """The bins and counts of each input of a gate, by input."""
+    cytometry = {}
+    for x in ucf.by_gate('gate_cytometry',gate):
+        for data in x.data:
+            cytometry[data.input] = {'bins'  : data.bins,
+                                     'counts': data.counts}
+    if len(cytometry) == 0:
+        raise RuntimeError("No cytometry for gate '%s'." % gate)
+    return cytometry
+
+def histogram_vertices(bins,counts):
+    """The outline of a histogram as arrays of x and y vertices, with each
+    bin edge halfway between its bin centers on the log scale."""
+    bins = numpy.asarray(bins,dtype=float)
+    counts = numpy.asarray(counts,dtype=float)
+    edges = numpy.empty(len(bins) + 1)
+    if len(bins) > 1:
+        edges[1:-1] = numpy.sqrt(bins[1:] * bins[:-1])
+        edges[0] = bins[0] * bins[0] / edges[1]
+        edges[-1] = bins[-1] * bins[-1] / edges[-2]
+    else:
+        edges[:] = bins[0] * numpy.array([0.9,1.1])
+    x = numpy.repeat(edges,2)
+    y = numpy.zeros(len(x))
+    y[1:-1] = numpy.repeat(counts,2)
+    return x, y
+
+# the default width of the bars of earlier versions, in data units
+BAR_WIDTH = 0.8
+
+def plot(cytometry,bars=False):
+    """A figure of the histograms of a gate, one panel per input.
+
+    Each histogram is one filled polygon, or with bars one bar artist per
+    bin as earlier versions drew them. Either way the axes get the limits
+    the bars give them.
+    """
+    fig = plt.figure()
+    ax = fig.subplots(len(cytometry),1,sharex=True,squeeze=False)[:,0]
+
+    for i,key in enumerate(sorted(cytometry.keys())):
+        ax[i].set_xscale('log')
+        if bars:
+            ax[i].bar(cytometry[key]['bins'],cytometry[key]['counts'],BAR_WIDTH)
+        else:
+            (x,y) = histogram_vertices(cytometry[key]['bins'],cytometry[key]['counts'])
+            # the polygon is added without touching the data limits, which
+            # are those of the bars, so the x range spans every bin
+            ax[i].add_artist(Polygon(numpy.column_stack([x,y]),closed=True,linewidth=0,facecolor='C0'))
+            bins = numpy.asarray(cytometry[key]['bins'],dtype=float)
+            counts = numpy.asarray(cytometry[key]['counts'],dtype=float)
+            ax[i].update_datalim(numpy.column_stack([numpy.concatenate([bins - BAR_WIDTH / 2,bins + BAR_WIDTH / 2]),
+                                                     numpy.concatenate([counts,counts])]))
+            ax[i].autoscale_view()
+            ax[i].set_ylim(bottom=0)
+        ax[i].text(0.85,0.5,key,ha='left',va='center',transform=ax[i].transAxes)
+        ax[i].set_yticklabels([])
+        if i == len(cytometry) - 1:
+            axis = "y"
+        else:
+            axis = "both"
+        ax[i].tick_params(axis=axis,
+                          which='both',
+                          bottom=False,
+                          top=False,
+                          right=False,
+                          left=False,
+                          labelleft=False)
+
+    fig.subplots_adjust(hspace=0)
+    return fig
+
+# the cytometry of every gate to render and how to draw it, shared with
+# forked workers
+_cytometry = {}
+_bars = False
+
+def _render(job):
+    (gate,out_file) = job
+    fig = plot(_cytometry[gate],_bars)
+    fig.savefig(out_file + ".png",bbox_inches='tight')
+    plt.close(fig)
+    return out_file + ".png"
+
+def main():
+    global _bars
+
+    parser = argparse.ArgumentParser(description='Plot the cytometry histograms of gates from a UCF.')
+    parser.add_argument('-u','--ucf',required=True,help='UCF file')
+    parser.add_argument('-g','--gate',action='append',help='gate; repeat for several gates')
+    parser.add_argument('-a','--all',action='store_true',help='every gate with cytometry in the UCF')
+    parser.add_argument('-o','--outfile',help='output file basename, for one gate')
+    parser.add_argument('-d','--outdir',help='output directory of the GATE.png files (default the current directory)')
+    parser.add_argument('--pdf',help='write every gate as a page of this PDF instead of PNGs')
+    parser.add_argument('-j','--jobs',type=int,default=1,help='render the PNGs in N processes')
+    parser.add_argument('--bars',action='store_true',help='draw one bar per bin instead of one filled histogram per input (slow)')
+    args = parser.parse_args()
+    if not args.gate and not args.all:
+        parser.error('--gate or --all required.')
+    if args.jobs < 1:
+        parser.error('--jobs must be at least 1.')
+
+    # the UCF is read once, and only the cytometry of the gates is decoded
+    ucf = ucf_index.load(args.ucf,'gate_cytometry',args.gate)
+    if args.all:
+        gates = [x.gate_name for x in ucf.collections('gate_cytometry')]
+        if args.gate:
+            gates = [gate for gate in gates if gate in args.gate]
+    else:
+        gates = list(dict.fromkeys(args.gate))
+    if args.outfile and (len(gates) > 1 or args.all or args.outdir):
+        parser.error('--outfile is for one --gate, use --outdir or --pdf.')
+
+    for gate in gates:
+        _cytometry[gate] = read_cytometry(ucf,gate)
+    _bars = args.bars
+
+    if args.pdf:
+        # the pages go to one file in order, so they are drawn here
+        with PdfPages(args.pdf) as pdf:
+            for gate in gates:
+                fig = plot(_cytometry[gate],args.bars)
+                fig.suptitle(gate)
+                pdf.savefig(fig,bbox_inches='tight')
+                plt.close(fig)
+        return
+
+    if len(gates) == 1 and not args.all and args.outdir is None:
+        jobs = [(gates[0],args.outfile if args.outfile else gates[0])]
     else:
-        axis = "both"
-    ax[i].tick_params(axis=axis,
-                      which='both',
-                      bottom=False,
-                      top=False,
-                      right=False,
-                      left=False,
-                      labelleft=False)
-
-plt.subplots_adjust(hspace=0)
-# plt.tight_layout()
-
-out_file = args.outfile if args.outfile else args.gate
-plt.savefig(out_file + ".png",bbox_inches='tight')
+        outdir = args.outdir if args.outdir else '.'
+        os.makedirs(outdir,exist_ok=True)
+        jobs = [(gate,os.path.join(outdir,gate)) for gate in gates]
+
+    if args.jobs > 1 and len(jobs) > 1 and 'fork' in multiprocessing.get_all_start_methods():
+        with ProcessPoolExecutor(max_workers=args.jobs,mp_context=multiprocessing.get_context('fork')) as executor:
+            list(executor.map(_render,jobs))
+    else:
+        for job in jobs:
+            _render(job)
+
+if __name__ == "__main__":
+    main()
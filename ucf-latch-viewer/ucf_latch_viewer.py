@@ -1,55 +1,34 @@
-import json
+import os
+import sys
 import argparse
 import matplotlib.pyplot as plt
-import sympy
-import sympy.parsing.sympy_parser as sympy_parser
-from sympy.parsing.sympy_parser import standard_transformations, implicit_multiplication_application
-import sympy.utilities.lambdify as lambdify
 import numpy
 
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),os.pardir,'ucf-builder'))
+import ucf_index
+import response_kernels
+
 parser = argparse.ArgumentParser(description='Plot the cytometry histograms of a gate from a UCF.')
 parser.add_argument('-u','--ucf',required=True,help='UCF file')
 parser.add_argument('-1','--gate-1',required=True,dest='gate_1',help='first gate')
 parser.add_argument('-2','--gate-2',required=True,dest='gate_2',help='second gate')
 parser.add_argument('-o','--outfile',help='output file basename')
+parser.add_argument('--cache-dir',dest='cache_dir',default=response_kernels.CACHE_DIR,help='cache of compiled response functions')
 args = parser.parse_args()
 
-with open(args.ucf,'r') as ucf_file:
-    ucf = json.load(ucf_file)
-
-class Gate:
-    """Gate class."""
-
-    def __init__(self,name,params,equation):
-        self._name = name
-        expr = sympy_parser.parse_expr(equation,transformations=sympy_parser.standard_transformations + (sympy_parser.convert_xor,),evaluate=False)
-        expr = expr.subs(params)
-        self._f = lambdify(expr.free_symbols,expr)
-
-    @property
-    def name(self):
-        return self._name
-
-    @property
-    def f(self):
-        return self._f
+ucf = ucf_index.load(args.ucf,'response_functions',[args.gate_1,args.gate_2])
 
-def get_params(params):
-    p = {}
-    for param in params:
-        name = param['name']
-        value = param['value']
-        p[name] = value
-    return p
+def get_response_function(name):
+    x = ucf.gate('response_functions',name)
+    if x is None:
+        raise RuntimeError("No response function for gate '%s'." % name)
+    return x
 
-for x in ucf:
-    if x['collection'] == 'response_functions':
-        params = get_params(x['parameters'])
-        equation = x['equation']
-        if x['gate_name'] == args.gate_1:
-            gate_1 = Gate(args.gate_1,params,equation)
-        elif x['gate_name'] == args.gate_2:
-            gate_2 = Gate(args.gate_2,params,equation)
+# both gates are evaluated in one array operation; sympy is only imported
+# for an equation that is not in the kernel cache
+gates = response_kernels.ResponseFunctions([get_response_function(args.gate_1),
+                                            get_response_function(args.gate_2)],
+                                           args.cache_dir)
 
 fig, ax = plt.subplots()
 ax.set_xscale('log')
@@ -58,15 +37,14 @@ ax.set_yscale('log')
 # ax.axis('equal')
 
 x = numpy.logspace(-4,4)
-y1 = gate_1.f(x)
-y2 = gate_2.f(x)
+(y1,y2) = gates(x)
 
-plt.plot(x,y1,label=gate_1.name)
-plt.plot(y2,x,label=gate_2.name)
+plt.plot(x,y1,label=args.gate_1)
+plt.plot(y2,x,label=args.gate_2)
 ax.set_aspect('equal','box')
 plt.legend()
 
 plt.tight_layout()
 
-out_file = args.outfile if args.outfile else gate_1.name + '_' + gate_2.name
+out_file = args.outfile if args.outfile else args.gate_1 + '_' + args.gate_2
 plt.savefig(out_file + ".png",bbox_inches='tight')